@@ -120,15 +120,9 @@ def image_conversions(img_BGR):
 # Predict skin pixels
 def skin_predict(images):
     height, width = images["grayscale"].shape
-    images["skin_predict"] = np.empty_like(images["grayscale"])
-    images["skin_predict"][:] = images["grayscale"]
-
-    for i in range(height):
-        for j in range(width):
-            if((images["HSV"].item(i, j, 0) <= 170) and (140 <= images["YCrCb"].item(i, j, 1) <= 170) and (90 <= images["YCrCb"].item(i, j, 2) <= 120)):
-                images["skin_predict"][i, j] = 255
-            else:
-                images["skin_predict"][i, j] = 0
+    hue = cv2.inRange(images["HSV"], (0, 0, 0), (170, 255, 255))
+    chroma = cv2.inRange(images["YCrCb"], (0, 140, 90), (255, 170, 120))
+    images["skin_predict"] = cv2.bitwise_and(hue, chroma)
     return height, width
 
 # Contruction the dataframe for K-means clustering
@@ -351,20 +351,28 @@
 
 
 import os
+import gc
 import base64
-import traceback
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import io
 from io import BytesIO
 import numpy as np
 from PIL import Image
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_restful import Api, Resource, reqparse
-from models.skin_tone.skin_tone_knn import identify_skin_tone
-from models.recommender.rec import recs_essentials, makeup_recommendation
 from flask_cors import CORS
+from preprocessing import prepare_image, content_hash, perceptual_hash, is_raw_image, base64_image_bytes
+from inference import MODEL_INPUT_SHAPE, FusedModel, TFLiteModel, LiteModels, MicroBatcher
+from cache import make_cache
+from tone_pool import TonePool
+import logs
+import metrics
 
 
 # Initialize Flask app
@@ -374,6 +382,44 @@ CORS(app, resources={r"/*": {"origins": "https://sayskin-live.onrender.com",
                             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
                             "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"]}})
 api = Api(app)
+log = logs.get_logger()
+
+# Largest accepted request body. Flask stops reading bodies sent without a
+# Content-Length (chunked) one byte past it, so request_body() can tell
+max_upload_bytes = int(os.environ.get('MAX_UPLOAD_BYTES', 16 * 2**20))
+app.config['MAX_CONTENT_LENGTH'] = max_upload_bytes + 1
+
+def payload_too_large():
+    return jsonify({"error": f"Payload too large (limit {max_upload_bytes} bytes)"}), 413
+
+# Per request: the log sampling decision, and the start of its duration on /metrics
+@app.before_request
+def start_request():
+    logs.sample_request()
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(route, time.perf_counter() - start)
+    return response
+
+# Reject oversize uploads from their Content-Length, before any of the body is read
+@app.before_request
+def reject_oversize_upload():
+    if request.content_length is not None and request.content_length > max_upload_bytes:
+        return payload_too_large()
+
+# The request body as one bytes object (cached by Flask, shared by BytesIO).
+# Uploads are buffered whole rather than streamed: PIL needs a seekable file
+# and the base64 fast path a contiguous buffer, so MAX_UPLOAD_BYTES bounds it
+def request_body():
+    body = request.get_data()
+    if len(body) > max_upload_bytes:
+        raise RequestEntityTooLarge()
+    return body
 
 # Create static directory if it doesn't exist
 os.makedirs('./static', exist_ok=True)
@@ -382,6 +428,23 @@ os.makedirs('./static', exist_ok=True)
 class_names1 = ['Dry_skin', 'Normal_skin', 'Oil_skin']
 class_names2 = ['Low', 'Moderate', 'Severe']
 skin_tone_dataset = 'models/skin_tone/skin_tone_dataset.csv'
+skin_model_path = './models/skin_model/skin_model.keras'
+acne_model_path = './models/acne_model/acne_model.keras'
+
+# 'keras' or 'tflite' (the .tflite exports next to the .keras files, see export_tflite.py);
+# the tflite backend never imports TensorFlow if ai-edge-litert/tflite-runtime is installed
+model_backend = os.environ.get('MODEL_BACKEND', 'keras').lower()
+
+# Micro-batching of concurrent model calls (useful with threaded workers)
+inference_batching = os.environ.get('INFERENCE_BATCHING', '0').lower() in ('1', 'true', 'yes')
+inference_max_batch = int(os.environ.get('INFERENCE_MAX_BATCH', 8))
+inference_max_wait_ms = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 5))
+
+# Warm-up in get_model(): synthetic batches of these sizes (default 1, or
+# every size up to INFERENCE_MAX_BATCH with batching) and one skin tone run
+model_warmup = os.environ.get('MODEL_WARMUP', '1').lower() in ('1', 'true', 'yes')
+warmup_batch_sizes = [int(size) for size in os.environ.get('WARMUP_BATCH_SIZES', '').split(',') if size.strip()] \
+    or list(range(1, inference_max_batch + 1) if inference_batching else [1])
 
 # Map from model output to frontend expected values
 skin_type_mapping = {
@@ -390,27 +453,224 @@ skin_type_mapping = {
     'Oil_skin': 'Oily'
 }
 
+# Startup mode: 'eager' loads every heavy component at import (the default),
+# 'background' loads them on a warm-up thread so / answers right away, and
+# 'lazy' loads each one the first time a request needs it
+startup_mode = os.environ.get('STARTUP_MODE', 'eager').lower()
+process_start = time.time()
+
+# Until get_model() runs
+model1 = model2 = fused_model = inference_model = analysis_version = None
+
 # Load Models
+def tflite_path(keras_path):
+    return os.path.splitext(keras_path)[0] + '.tflite'
+
+def load_classifier(path):
+    if model_backend == 'tflite':
+        return TFLiteModel(tflite_path(path))
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
 def get_model():
-    global model1, model2
+    global model1, model2, fused_model, inference_model, analysis_version
     try:
-        model1 = load_model('./models/skin_model/skin_model.keras')
-        print('✅ Model 1 loaded successfully')
+        model1 = load_classifier(skin_model_path)
+        log.info("Model 1 loaded (%s)", model_backend)
     except Exception as e:
-        print(f'❌ Error loading Model 1: {str(e)}')
+        log.error("Error loading Model 1: %s", e)
         model1 = None
 
     try:
-        model2 = load_model('./models/acne_model/acne_model.keras')
-        print("✅ Model 2 loaded successfully")
+        model2 = load_classifier(acne_model_path)
+        log.info("Model 2 loaded (%s)", model_backend)
     except Exception as e:
-        print(f'❌ Error loading Model 2: {str(e)}')
+        log.error("Error loading Model 2: %s", e)
         model2 = None
 
-get_model()
+    # Both models in one traced graph for the request path
+    if model_backend == 'tflite':
+        fused_model = LiteModels(model1, model2)
+    else:
+        fused_model = FusedModel(model1, model2)
+    inference_model = fused_model
+    if inference_batching:
+        inference_model = MicroBatcher(fused_model, inference_max_batch, inference_max_wait_ms)
+
+    # Scopes cached analyses to the model and dataset files they came from
+    model_paths = [skin_model_path, acne_model_path]
+    if model_backend == 'tflite':
+        model_paths = [tflite_path(p) for p in model_paths]
+    analysis_version = files_version(*model_paths, skin_tone_dataset)
+
+    if model_warmup:
+        warm_up_models()
+
+# Call fn and record its wall time in timings[name]
+def timed(timings, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+# Warm-up duration per stage, and the first real (uncached) analysis after it
+warmup_stats = {"seconds": None, "stages": {}, "batch_sizes": warmup_batch_sizes, "error": None}
+first_analysis = {}
+first_analysis_lock = threading.Lock()
+
+# Pays tf.function tracing, kernel selection and the skin tone pipeline's
+# first-call costs before the worker reports ready, not on a user request
+def warm_up_models():
+    stages = {}
+    start = time.perf_counter()
+    try:
+        if model1 is not None or model2 is not None:
+            for size in warmup_batch_sizes:
+                batch = np.zeros((size,) + MODEL_INPUT_SHAPE, dtype=np.float32)
+                timed(stages, f"fused_batch_{size}", fused_model, batch)
+            single = np.zeros((1,) + MODEL_INPUT_SHAPE, dtype=np.float32)
+            for name, model in (("skin_model", model1), ("acne_model", model2)):
+                if model is not None:
+                    timed(stages, name, model.predict_on_batch, single)
+        require('skin_tone')
+        timed(stages, "skin_tone", skin_tone_of, warmup_image())
+    except Exception as e:
+        warmup_stats["error"] = str(e)
+        log.error("Error during warm-up: %s", e)
+    warmup_stats.update(seconds=time.perf_counter() - start, stages=stages)
+    log.info("Warm-up done in %.2fs", warmup_stats['seconds'])
+
+# Skin-coloured noise at the skin detection input size (500x375 BGR)
+def warmup_image():
+    rng = np.random.default_rng(0)
+    skin = np.array([120, 150, 200], dtype=np.int16)
+    return np.clip(skin + rng.integers(-30, 30, (500, 375, 3)), 0, 255).astype(np.uint8)
+
+# Stage timings of an uncached analysis, onto /metrics and, once, /stats/warmup
+def record_analysis(timings):
+    metrics.observe_stages(timings)
+    if not first_analysis:
+        with first_analysis_lock:
+            if not first_analysis:
+                first_analysis.update(timings, uptime=time.time() - process_start)
+
+def files_version(*paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+        digest.update(f"{path}:{mtime};".encode())
+    return digest.hexdigest()[:16]
+
+# Runs skin tone detection next to the CNN inference of the same request
+analysis_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('ANALYSIS_THREADS', 4)),
+                                   thread_name_prefix='analysis')
+
+# TONE_WORKERS > 0 moves skin tone detection off the server process onto that
+# many worker processes (see tone_pool.py); TONE_SLOTS bounds images in flight
+tone_workers = int(os.environ.get('TONE_WORKERS', 0))
+tone_slots = int(os.environ.get('TONE_SLOTS', 0)) or None
+tone_pool = None
+
+# Repeat-upload cache - set ANALYSIS_CACHE_PATH to share it between workers
+analysis_cache = make_cache(os.environ.get('ANALYSIS_CACHE_PATH'),
+                            int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024)),
+                            float(os.environ.get('ANALYSIS_CACHE_TTL', 86400)))
+# Also match near-duplicates (re-encoded or slightly edited copies) by perceptual hash
+analysis_cache_perceptual = os.environ.get('ANALYSIS_CACHE_PERCEPTUAL', '0').lower() in ('1', 'true', 'yes')
+
+# Recommender tables (pandas) and the skin tone pipeline (OpenCV, scikit-learn)
+def load_recommender():
+    global rec, recs_essentials, makeup_recommendation
+    from models.recommender import rec
+    from models.recommender.rec import recs_essentials, makeup_recommendation
+
+def load_skin_tone():
+    global identify_skin_tone, tone_pool
+    from models.skin_tone.skin_tone_knn import identify_skin_tone, get_classifier
+    get_classifier(skin_tone_dataset)
+    if tone_workers > 0:
+        tone_pool = TonePool(skin_tone_dataset, tone_workers, tone_slots)
+        # a preloading master only forks; each server worker starts its own pool
+        if not defer_model_load:
+            tone_pool.start()
+
+# Skin tone of a BGR array, on the tone process pool when there is one;
+# timings, when given, gets the seconds of each skin tone stage
+def skin_tone_of(bgr, timings=None):
+    if tone_pool is not None:
+        tone, stages = tone_pool.submit(bgr).result()
+        if timings is not None:
+            stages.pop("tone")  # the caller's "tone" also covers the wait for a worker
+            timings.update(stages)
+        return tone
+    return identify_skin_tone(bgr, dataset=skin_tone_dataset, timings=timings)
+
+COMPONENT_LOADERS = {
+    'recommender': load_recommender,
+    'skin_tone': load_skin_tone,
+    'models': get_model,
+}
+# Seconds each component took to load (None until loaded), and load errors
+components = {name: None for name in COMPONENT_LOADERS}
+component_errors = {}
+component_locks = {name: threading.Lock() for name in COMPONENT_LOADERS}
+
+# Load the named components unless already loaded; blocks while another
+# thread (e.g. the warm-up thread) is loading the same one
+def require(*names):
+    for name in names:
+        if components[name] is not None:
+            continue
+        with component_locks[name]:
+            if components[name] is None:
+                start = time.perf_counter()
+                COMPONENT_LOADERS[name]()
+                components[name] = time.perf_counter() - start
+                component_errors.pop(name, None)
+
+def warm_up():
+    for name in COMPONENT_LOADERS:
+        try:
+            require(name)
+        except Exception as e:
+            component_errors[name] = str(e)
+            log.error("Error loading %s: %s", name, e)
+
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+# TensorFlow cannot be used across fork(), so a preloading server (see
+# gunicorn.conf.py) sets DEFER_MODEL_LOAD and loads the models per worker;
+# a background warm-up is started there too, since threads do not survive fork
+defer_model_load = os.environ.get('DEFER_MODEL_LOAD', '0') == '1'
+# Tone pool workers are spawned, and under `python app.py` each one re-imports
+# this file as __mp_main__; they must not load the models or start a pool
+if __name__ == '__mp_main__':
+    pass
+elif startup_mode == 'eager':
+    require('recommender', 'skin_tone')
+    if not defer_model_load:
+        require('models')
+elif startup_mode == 'background' and not defer_model_load:
+    start_warm_up()
+
+# Called in the master before forking. gc.freeze() moves the preloaded
+# objects out of the collected generations, so worker collections do not
+# write to their pages; refcount updates still dirty the pages they touch.
+# The recommender tables are made read-only only to catch accidental
+# writes, which sharing does not depend on
+def freeze_shared_state():
+    if components['recommender'] is not None:
+        rec.freeze()
+    gc.collect()
+    gc.freeze()
 
 # Image processing function
 def load_image(img_path):
+    from tensorflow.keras.preprocessing import image
     img = image.load_img(img_path, target_size=(224, 224))
     img_tensor = image.img_to_array(img)
     img_tensor = np.expand_dims(img_tensor, axis=0)
@@ -418,33 +678,148 @@ def load_image(img_path):
     return img_tensor
 
 # Prediction functions
-def prediction_skin(img_path):
+def prediction_skin(img_tensor):
+    require('models')
     try:
         if model1 is None:
             return "Model 1 not loaded"
-        new_image = load_image(img_path)
-        pred1 = model1.predict(new_image)
+        with metrics.timer("prediction_skin"):
+            pred1 = model1.predict_on_batch(img_tensor)
         return class_names1[np.argmax(pred1[0])]
     except Exception as e:
-        print(f"Error in skin prediction: {str(e)}")
+        log.exception("Error in skin prediction")
         return f"Error in skin prediction: {str(e)}"
 
-def prediction_acne(img_path):
+def prediction_acne(img_tensor):
+    require('models')
     try:
         if model2 is None:
             return "Model 2 not loaded"
-        new_image = load_image(img_path)
-        pred2 = model2.predict(new_image)
+        with metrics.timer("prediction_acne"):
+            pred2 = model2.predict_on_batch(img_tensor)
         return class_names2[np.argmax(pred2[0])]
     except Exception as e:
-        print(f"Error in acne prediction: {str(e)}")
+        log.exception("Error in acne prediction")
         return f"Error in acne prediction: {str(e)}"
 
+# Skin type and acne from one fused model call
+def prediction_skin_acne(img_tensor):
+    require('models')
+    try:
+        pred1, pred2 = inference_model(img_tensor)
+    except Exception as e:
+        log.exception("Error in skin/acne prediction")
+        return f"Error in skin prediction: {str(e)}", f"Error in acne prediction: {str(e)}"
+    skin = class_names1[np.argmax(pred1[0])] if pred1 is not None else "Model 1 not loaded"
+    acne = class_names2[np.argmax(pred2[0])] if pred2 is not None else "Model 2 not loaded"
+    return skin, acne
+
+# Server-Timing header value, durations in milliseconds
+def server_timing(timings):
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+# Cached or fresh {type, tone, acne} for a prepared image, plus stage timings
+def analyze_prepared(prepared):
+    keys = analysis_keys(prepared)
+    data = cached_analysis(keys)
+    if data is not None:
+        return data, {}
+
+    # skin tone on the analysis pool while the CNNs run on this thread
+    require('skin_tone')
+    timings = {}
+    start = time.perf_counter()
+    tone_future = analysis_pool.submit(timed, timings, "tone", skin_tone_of, prepared["BGR"], timings)
+    skin_type_raw, acne_type = timed(timings, "skin_acne", prediction_skin_acne, prepared["tensor"])
+    skin_type = skin_type_mapping.get(skin_type_raw, 'Normal')
+    tone = tone_future.result()
+    timings["total"] = time.perf_counter() - start
+    record_analysis(timings)
+
+    data = {"type": skin_type, "tone": max(1, min(6, int(tone))), "acne": acne_type}
+    store_analysis(keys, skin_type_raw, acne_type, data)
+    return data, timings
+
+# Cache keys for a prepared image: exact pixel hash, then optional perceptual hash
+def analysis_keys(prepared):
+    require('models')
+    keys = [f"{analysis_version}:px:{content_hash(prepared)}"]
+    if analysis_cache_perceptual:
+        keys.append(f"{analysis_version}:ph:{perceptual_hash(prepared)}")
+    return keys
+
+def cached_analysis(keys):
+    for key in keys:
+        data = analysis_cache.get(key)
+        if data is not None:
+            return data
+    return None
+
+# Only real model outputs are cached, never "Model not loaded" placeholders
+def store_analysis(keys, skin_type_raw, acne_type, data):
+    if skin_type_raw in class_names1 and acne_type in class_names2:
+        for key in keys:
+            analysis_cache.set(key, data)
+
 # Home route
 @app.route('/')
 def home():
     return jsonify({"message": "Backend is running"}), 200
 
+# Warm-up durations and the stage timings of the first uncached analysis
+@app.route('/stats/warmup')
+def warmup_metrics():
+    return jsonify({"warmup": warmup_stats, "first_analysis": first_analysis or None}), 200
+
+# Which heavy components are loaded, and whether all of them are
+def readiness_report():
+    report = {name: {"loaded": seconds is not None, "seconds": seconds, "error": component_errors.get(name)}
+              for name, seconds in components.items()}
+    report['models'].update(skin=model1 is not None, acne=model2 is not None, backend=model_backend,
+                            warmup_seconds=warmup_stats["seconds"])
+    ready = all(seconds is not None for seconds in components.values())
+    return {"ready": ready, "startup_mode": startup_mode, "components": report}
+
+# Liveness: the process is up and answering
+@app.route('/health/live')
+def liveness():
+    return jsonify({"alive": True, "uptime": round(time.time() - process_start, 3)}), 200
+
+# Readiness: 503 until every component is loaded (e.g. during a background warm-up)
+@app.route('/health/ready')
+def readiness():
+    report = readiness_report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+# Stage and request latency histograms, Prometheus text format
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Micro-batching metrics
+@app.route('/stats/inference')
+def inference_stats():
+    if not isinstance(inference_model, MicroBatcher):
+        return jsonify({"batching": False}), 200
+    return jsonify(dict(inference_model.stats(), batching=True)), 200
+
+# Tone process pool metrics: queue depth, queue wait and worker time
+@app.route('/stats/tone')
+def tone_stats():
+    if tone_pool is None:
+        return jsonify({"process_pool": False}), 200
+    return jsonify(dict(tone_pool.stats(), process_pool=True)), 200
+
+# /recommend cache metrics
+@app.route('/stats/recommend')
+def recommend_stats():
+    return jsonify(recommend_cache.stats()), 200
+
+# Repeat-upload cache metrics
+@app.route('/stats/analysis')
+def analysis_stats():
+    return jsonify(dict(analysis_cache.stats(), perceptual=analysis_cache_perceptual)), 200
+
 # Add explicit CORS preflight handler
 @app.route('/upload', methods=['OPTIONS'])
 def upload_options():
@@ -456,162 +831,125 @@ def upload_options():
 # Modified upload route to format data for frontend
 @app.route('/upload', methods=['POST'])
 def upload():
-    print("==== UPLOAD REQUEST RECEIVED ====")
     try:
-        # First, just log everything we can about the request
-        print(f"Content-Type: {request.content_type}")
-        print(f"Request method: {request.method}")
-        print(f"Is JSON: {request.is_json}")
-        print(f"Files: {request.files}")
-        print(f"Form: {request.form}")
-        
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("upload: content-type %s, json %s, files %s, form %s",
+                      request.content_type, request.is_json, request.files, request.form)
+
         # Step 1: Just try to process the image (nothing else)
         # Handle different input types
         if request.content_type and 'application/json' in request.content_type:
             # Handle base64 JSON image upload
-            print("Processing JSON data")
-            data = request.get_json()
-            if not data:
-                print("No JSON data found")
-                return jsonify({"error": "No JSON data provided"}), 400
-                
-            if "file" not in data:
-                print("No file key in JSON")
-                return jsonify({"error": "No file provided in JSON"}), 400
+            # Usual case: the base64 field decoded in place from the raw body
+            image_data = base64_image_bytes(request_body())
+            if image_data is None:
+                data = request.get_json()
+                if not data:
+                    log.warning("upload: no JSON data")
+                    return jsonify({"error": "No JSON data provided"}), 400
+
+                if "file" not in data:
+                    log.warning("upload: no file key in JSON")
+                    return jsonify({"error": "No file provided in JSON"}), 400
 
             try:
-                # Handle both with and without data URL prefix
-                if ',' in data["file"]:
-                    print("Data URI format detected")
-                    base64_str = data["file"].split(',')[1]
-                else:
-                    print("Raw base64 format detected")
-                    base64_str = data["file"]
-                    
-                print(f"Base64 string length: {len(base64_str)}")
-                image_data = base64.b64decode(base64_str)
-                print(f"Decoded image data length: {len(image_data)}")
-                
+                if image_data is None:
+                    # Handle both with and without data URL prefix
+                    if ',' in data["file"]:
+                        base64_str = data["file"].split(',')[1]
+                    else:
+                        base64_str = data["file"]
+                    image_data = base64.b64decode(base64_str)
+
                 # Try to open the image
                 im = Image.open(BytesIO(image_data))
-                print(f"Image opened successfully. Format: {im.format}, Size: {im.size}, Mode: {im.mode}")
+                log.debug("upload: base64 image, %d bytes, %s %s %s", len(image_data), im.format, im.size, im.mode)
             except Exception as img_err:
-                print(f"ERROR processing base64 image: {str(img_err)}")
-                traceback.print_exc()
+                log.warning("upload: invalid base64 image: %s", img_err)
                 return jsonify({"error": f"Invalid image data: {str(img_err)}"}), 400
 
+        elif request.mimetype and is_raw_image(request.mimetype):
+            # Raw image body: decoded straight from the one buffered copy
+            try:
+                im = Image.open(BytesIO(request_body()))
+                log.debug("upload: raw image, %s %s %s", im.format, im.size, im.mode)
+            except RequestEntityTooLarge:
+                raise
+            except Exception as img_err:
+                log.warning("upload: invalid raw image body: %s", img_err)
+                return jsonify({"error": f"Invalid image format: {str(img_err)}"}), 400
+
         elif request.files and 'file' in request.files:
             # Handle form-data upload
-            print("Processing form-data upload")
             uploaded_file = request.files['file']
             if uploaded_file.filename == '':
-                print("Empty filename")
+                log.warning("upload: empty filename")
                 return jsonify({"error": "No file selected"}), 400
-                
+
             try:
-                print(f"File name: {uploaded_file.filename}")
                 im = Image.open(uploaded_file)
-                print(f"Image opened successfully. Format: {im.format}, Size: {im.size}, Mode: {im.mode}")
+                log.debug("upload: form-data file %s, %s %s %s", uploaded_file.filename, im.format, im.size, im.mode)
             except Exception as img_err:
-                print(f"ERROR opening uploaded file: {str(img_err)}")
-                traceback.print_exc()
+                log.warning("upload: invalid uploaded file: %s", img_err)
                 return jsonify({"error": f"Invalid image format: {str(img_err)}"}), 400
         else:
-            print(f"Invalid request format. Content-Type: {request.content_type}")
-            print(f"Request data: {request.data}")
-            return jsonify({"error": "No valid image provided. Send either JSON with base64 or form-data with file."}), 400
+            log.warning("upload: no image in request, content-type %s, %s bytes",
+                        request.content_type, request.content_length)
+            return jsonify({"error": "No valid image provided. Send JSON with base64, form-data with file "
+                                     "or the image itself as image/* or application/octet-stream."}), 400
 
-        # Step 2: Try to save the image
+        # Step 2: Decode once into the model tensor and the skin detection array
         try:
-            # Ensure static directory exists
-            if not os.path.exists('./static'):
-                os.makedirs('./static')
-                print("Created static directory")
-                
-            file_path = "./static/image.png"
-            print(f"Saving image to {file_path}")
-            im.save(file_path)
-            print("Image saved successfully")
-        except Exception as save_err:
-            print(f"ERROR saving image: {str(save_err)}")
-            traceback.print_exc()
-            return jsonify({"error": f"Error saving image: {str(save_err)}"}), 500
-
-        # Step 3: Check if skin tone dataset exists
-        if not os.path.exists(skin_tone_dataset):
-            print(f"ERROR: Skin tone dataset not found at {skin_tone_dataset}")
-            return jsonify({"error": f"Skin tone dataset not found at {skin_tone_dataset}"}), 500
-        else:
-            print(f"Skin tone dataset found at {skin_tone_dataset}")
+            with metrics.timer("decode"):
+                prepared = prepare_image(im)
+        except Exception as prep_err:
+            log.warning("upload: preprocessing failed: %s", prep_err)
+            return jsonify({"error": f"Invalid image data: {str(prep_err)}"}), 400
 
-        # Step 4: Run predictions one by one
-        try:
-            print("Running skin type prediction")
-            skin_type_raw = prediction_skin(file_path)
-            # Map from model prediction to frontend values
-            skin_type = skin_type_mapping.get(skin_type_raw, 'Normal')  # Default to Normal if mapping fails
-            print(f"Skin type result: {skin_type_raw} -> {skin_type}")
-        except Exception as skin_err:
-            print(f"ERROR in skin prediction: {str(skin_err)}")
-            traceback.print_exc()
-            return jsonify({"error": f"Error in skin prediction: {str(skin_err)}"}), 500
-            
+        # Step 3: Cached result, or skin tone and the CNNs run side by side
         try:
-            print("Running acne prediction")
-            acne_type = prediction_acne(file_path)
-            print(f"Acne type result: {acne_type}")
-        except Exception as acne_err:
-            print(f"ERROR in acne prediction: {str(acne_err)}")
-            traceback.print_exc()
-            return jsonify({"error": f"Error in acne prediction: {str(acne_err)}"}), 500
-            
-        try:
-            print("Running skin tone identification")
-            tone = identify_skin_tone(file_path, dataset=skin_tone_dataset)
-            # Ensure tone is between 1 and 6
-            tone_value = max(1, min(6, int(tone)))
-            print(f"Tone result: {tone} -> {tone_value}")
-        except Exception as tone_err:
-            print(f"ERROR in tone identification: {str(tone_err)}")
-            traceback.print_exc()
-            return jsonify({"error": f"Error in tone identification: {str(tone_err)}"}), 500
+            data, timings = analyze_prepared(prepared)
+        except Exception as analysis_err:
+            log.exception("upload: analysis failed")
+            return jsonify({"error": f"Error in analysis: {str(analysis_err)}"}), 500
+        log.info("upload: %s %s", data, server_timing(timings) if timings else "(cached)")
 
         # Final response formatted specifically for the frontend Form component
         result = {
             "message": "Image analyzed successfully",
-            "data": {
-                "type": skin_type,
-                "tone": tone_value,
-                "acne": acne_type
-            }
+            "data": data
         }
-        print("Returning successful response:", result)
-        return jsonify(result), 200
+        return jsonify(result), 200, {"Server-Timing": server_timing(timings)}
 
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
-        print("UNHANDLED EXCEPTION in upload route:")
-        traceback.print_exc()
-        print(f"Error details: {str(e)}")
+        log.exception("Unhandled exception in upload route")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    print("==== ANALYZE REQUEST RECEIVED ====")
     try:
         # Handle base64 in JSON
         if request.is_json:
-            data = request.get_json()
-            if "file" not in data:
-                return jsonify({"error": "No file key in JSON"}), 400
-            
-            if ',' in data["file"]:
-                base64_str = data["file"].split(',')[1]
-            else:
-                base64_str = data["file"]
-            
-            image_data = base64.b64decode(base64_str)
+            image_data = base64_image_bytes(request_body())
+            if image_data is None:
+                data = request.get_json()
+                if "file" not in data:
+                    return jsonify({"error": "No file key in JSON"}), 400
+
+                if ',' in data["file"]:
+                    base64_str = data["file"].split(',')[1]
+                else:
+                    base64_str = data["file"]
+
+                image_data = base64.b64decode(base64_str)
             im = Image.open(BytesIO(image_data))
-        
+
+        # Handle the raw image as the request body
+        elif is_raw_image(request.mimetype):
+            im = Image.open(BytesIO(request_body()))
+
         # Handle file upload (form-data)
         elif 'file' in request.files:
             uploaded_file = request.files['file']
@@ -622,30 +960,24 @@ def analyze():
         else:
             return jsonify({"error": "No valid image provided"}), 400
 
-        # Save to static folder
-        file_path = "./static/analyze_input.png"
-        im.save(file_path)
+        # Decode once for all three analyzers
+        with metrics.timer("decode"):
+            prepared = prepare_image(im)
 
         # Run predictions
-        skin_type_raw = prediction_skin(file_path)
-        skin_type = skin_type_mapping.get(skin_type_raw, 'Normal')
-        acne_type = prediction_acne(file_path)
-        tone = identify_skin_tone(file_path, dataset=skin_tone_dataset)
-        tone_value = max(1, min(6, int(tone)))
+        data, timings = analyze_prepared(prepared)
 
         # Return predictions in format expected by frontend
         result = {
             "message": "Analysis complete",
-            "data": {
-                "type": skin_type,
-                "acne": acne_type,
-                "tone": tone_value
-            }
+            "data": data
         }
-        return jsonify(result), 200
+        return jsonify(result), 200, {"Server-Timing": server_timing(timings)}
 
+    except RequestEntityTooLarge:
+        return payload_too_large()
     except Exception as e:
-        traceback.print_exc()
+        log.exception("Unhandled exception in analyze route")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
@@ -655,20 +987,46 @@ rec_args.add_argument("tone", type=int, required=True)
 rec_args.add_argument("type", type=str, required=True)
 rec_args.add_argument("features", type=dict, required=True)
 
+# /recommend response cache - set RECOMMEND_CACHE_PATH to share it between workers
+recommend_cache = make_cache(os.environ.get('RECOMMEND_CACHE_PATH'),
+                             int(os.environ.get('RECOMMEND_CACHE_SIZE', 4096)),
+                             float(os.environ.get('RECOMMEND_CACHE_TTL', 3600)))
+
+# Packed 0/1 feature bitmask + tone bucket + type, scoped to the loaded CSVs
+def recommendation_key(fv, skin_tone, skin_type):
+    if any(value not in (0, 1) for value in fv):
+        return None
+    mask = sum(value << i for i, value in enumerate(fv))
+    return f"{rec.data_version}:{len(fv)}:{mask}:{skin_tone}:{skin_type}"
+
+# /recommend response body for a features dict, tone 1-6 and skin type
+def recommend(features, tone, skin_type):
+    require('recommender')
+    skin_type = skin_type.lower()
+    skin_tone = 'light to medium' if 2 < tone < 4 else 'fair to light' if tone <= 2 else 'medium to dark'
+    fv = [int(value) for key, value in features.items()]
+    key = recommendation_key(fv, skin_tone, skin_type)
+    cached = recommend_cache.get(key) if key else None
+    if cached is None:
+        with metrics.timer("recommend_general"):
+            general = recs_essentials(fv, None)
+        with metrics.timer("recommend_makeup"):
+            makeup = makeup_recommendation(skin_tone, skin_type, shuffle=False)
+        cached = {'general': general, 'makeup': makeup}
+        if key:
+            recommend_cache.set(key, cached)
+    # cache the unshuffled makeup list, shuffle per response as before
+    makeup = list(cached['makeup'])
+    random.shuffle(makeup)
+    return {'general': cached['general'], 'makeup': makeup}
+
 class Recommendation(Resource):
     def put(self):
         try:
             args = rec_args.parse_args()
-            features = args['features']
-            tone = args['tone']
-            skin_type = args['type'].lower()
-            skin_tone = 'light to medium' if 2 < tone < 4 else 'fair to light' if tone <= 2 else 'medium to dark'
-            fv = [int(value) for key, value in features.items()]
-            general = recs_essentials(fv, None)
-            makeup = makeup_recommendation(skin_tone, skin_type)
-            return {'general': general, 'makeup': makeup}
+            return recommend(args['features'], args['tone'], args['type'])
         except Exception as e:
-            traceback.print_exc()
+            log.exception("Error in recommendation")
             return {"error": str(e)}, 500
 
 # Create a simple manifest.json if it doesn't exist
@@ -682,7 +1040,7 @@ def serve_manifest():
         
         return send_from_directory('./static', 'manifest.json')
     except Exception as e:
-        print(f"Error serving manifest.json: {str(e)}")
+        log.exception("Error serving manifest.json")
         return jsonify({"error": str(e)}), 500
 
 # Create a default route for favicon.ico
@@ -697,7 +1055,7 @@ def favicon():
                 
         return send_from_directory('./static', 'favicon.ico', mimetype='image/vnd.microsoft.icon')
     except Exception as e:
-        print(f"Error serving favicon.ico: {str(e)}")
+        log.exception("Error serving favicon.ico")
         return "", 204  # Return no content instead of error
 
 # Add API resources
@@ -706,8 +1064,7 @@ api.add_resource(Recommendation, "/recommend")
 # Add global error handler
 @app.errorhandler(Exception)
 def handle_exception(e):
-    print(f"Unhandled exception: {str(e)}")
-    traceback.print_exc()
+    log.exception("Unhandled exception")
     return jsonify({"error": "Internal server error"}), 500
 
 # Run app
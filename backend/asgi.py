@@ -0,0 +1,235 @@
+"""
+ASGI entry point serving the same /upload, /analyze and /recommend
+contracts as the Flask app, for holding many slow uploads open without
+one worker process each.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Request bodies are streamed into memory under a size limit and only a
+bounded number are buffered at once; when that limit is reached new
+bodies are not read, so TCP flow control pushes back on clients. The
+CPU-bound analysis runs on a thread pool, at most
+ASGI_MAX_CONCURRENT_ANALYSES at a time, and shares the models, caches
+and analyzers loaded by app.py.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+import app as core
+import logs
+import metrics
+
+MAX_UPLOAD_BYTES = core.max_upload_bytes
+MAX_BUFFERED_UPLOADS = int(os.environ.get('ASGI_MAX_BUFFERED_UPLOADS', 1000))
+MAX_CONCURRENT_ANALYSES = int(os.environ.get('ASGI_MAX_CONCURRENT_ANALYSES', os.cpu_count() or 4))
+
+app = FastAPI()
+app.add_middleware(CORSMiddleware, allow_origins=["https://sayskin-live.onrender.com"],
+                   allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+                   allow_headers=["Content-Type", "Authorization", "X-Requested-With"])
+
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ANALYSES, thread_name_prefix='asgi')
+upload_slots = asyncio.Semaphore(MAX_BUFFERED_UPLOADS)
+analysis_slots = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+log = logs.get_logger()
+
+
+# Per request: the log sampling decision, and its duration on /metrics
+@app.middleware('http')
+async def observe_request(request, call_next):
+    logs.sample_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    metrics.request_seconds.observe(route.path if route else 'unmatched', time.perf_counter() - start)
+    return response
+
+
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error(message, status):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+# Stream the body in, rejecting it as soon as it passes the limit. Joined
+# into bytes once, so BytesIO(body) and memoryview(body) share it uncopied
+async def read_body(request):
+    declared = request.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES:
+        raise RequestError(f"Payload too large (limit {MAX_UPLOAD_BYTES} bytes)", 413)
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise RequestError(f"Payload too large (limit {MAX_UPLOAD_BYTES} bytes)", 413)
+    return b''.join(chunks)
+
+
+# Open the image from a JSON base64 body, a multipart "file" field or a raw image body
+def open_image(content_type, body):
+    mimetype, options = parse_options_header(content_type or '')
+    if core.is_raw_image(mimetype):
+        try:
+            return Image.open(BytesIO(body))
+        except Exception as img_err:
+            raise RequestError(f"Invalid image format: {str(img_err)}")
+    if mimetype == 'application/json':
+        image_data = core.base64_image_bytes(body)
+        if image_data is not None:
+            try:
+                return Image.open(BytesIO(image_data))
+            except Exception as img_err:
+                raise RequestError(f"Invalid image data: {str(img_err)}")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not data:
+            raise RequestError("No JSON data provided")
+        if not isinstance(data, dict) or not isinstance(data.get("file"), str):
+            raise RequestError("No file provided in JSON")
+        base64_str = data["file"].split(',')[1] if ',' in data["file"] else data["file"]
+        try:
+            return Image.open(BytesIO(base64.b64decode(base64_str)))
+        except Exception as img_err:
+            raise RequestError(f"Invalid image data: {str(img_err)}")
+    if mimetype == 'multipart/form-data':
+        _, _, files = FormDataParser().parse(BytesIO(body), mimetype, len(body), options)
+        uploaded_file = files.get('file')
+        if uploaded_file is not None:
+            if uploaded_file.filename == '':
+                raise RequestError("No file selected")
+            try:
+                return Image.open(uploaded_file.stream)
+            except Exception as img_err:
+                raise RequestError(f"Invalid image format: {str(img_err)}")
+    raise RequestError("No valid image provided. Send JSON with base64, form-data with file "
+                       "or the image itself as image/* or application/octet-stream.")
+
+
+def analyze_body(content_type, body):
+    im = open_image(content_type, body)
+    try:
+        with metrics.timer("decode"):
+            prepared = core.prepare_image(im)
+    except Exception as prep_err:
+        raise RequestError(f"Invalid image data: {str(prep_err)}")
+    return core.analyze_prepared(prepared)
+
+
+# /recommend arguments from the query string and a JSON object or form fields
+# (features as a JSON string), like the reqparse parser of the Flask resource:
+# ((tone, type, features), None) or (None, {argument: error})
+def recommend_args(request, body):
+    mimetype, options = parse_options_header(request.headers.get('content-type') or '')
+    args = dict(request.query_params)
+    if mimetype in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        _, form, _ = FormDataParser().parse(BytesIO(body), mimetype, len(body), options)
+        args.update(form.to_dict())
+    elif body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise RequestError("Request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise RequestError("JSON body must be an object")
+        args.update(data)
+
+    errors = {name: "Missing required parameter" for name in ("tone", "type", "features") if args.get(name) is None}
+    if errors:
+        return None, errors
+    try:
+        tone = int(args["tone"])
+    except (TypeError, ValueError):
+        errors["tone"] = f"Invalid integer: {args['tone']!r}"
+    features = args["features"]
+    if isinstance(features, str):
+        try:
+            features = json.loads(features)
+        except ValueError:
+            pass
+    if not isinstance(features, dict):
+        errors["features"] = "Must be an object of feature: 0/1"
+    if errors:
+        return None, errors
+    return (tone, str(args["type"]), features), None
+
+
+async def run_analysis(request, message):
+    try:
+        async with upload_slots:
+            body = await read_body(request)
+            async with analysis_slots:
+                loop = asyncio.get_running_loop()
+                data, timings = await loop.run_in_executor(
+                    executor, analyze_body, request.headers.get('content-type'), body)
+    except RequestError as e:
+        return error(str(e), e.status)
+    except Exception as e:
+        log.exception("Unhandled exception in analysis")
+        return error(f"Server error: {str(e)}", 500)
+    headers = {"Server-Timing": core.server_timing(timings)} if timings else None
+    return JSONResponse({"message": message, "data": data}, headers=headers)
+
+
+@app.get('/')
+async def home():
+    return {"message": "Backend is running"}
+
+
+@app.get('/health/live')
+async def liveness():
+    return {"alive": True, "uptime": round(time.time() - core.process_start, 3)}
+
+
+@app.get('/health/ready')
+async def readiness():
+    report = core.readiness_report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.post('/upload')
+async def upload(request: Request):
+    return await run_analysis(request, "Image analyzed successfully")
+
+
+@app.post('/analyze')
+async def analyze(request: Request):
+    return await run_analysis(request, "Analysis complete")
+
+
+@app.put('/recommend')
+async def recommend(request: Request):
+    try:
+        args, errors = recommend_args(request, await read_body(request))
+        if errors:
+            return JSONResponse({"message": errors}, status_code=400)
+        tone, skin_type, features = args
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, core.recommend, features, tone, skin_type)
+    except RequestError as e:
+        return error(str(e), e.status)
+    except Exception as e:
+        log.exception("Error in recommendation")
+        return error(str(e), 500)
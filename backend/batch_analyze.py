@@ -0,0 +1,226 @@
+"""
+Offline batch analysis of an image folder, glob or manifest.
+
+Run from backend/:
+  python batch_analyze.py <dir|glob|manifest> <out.csv|out.parquet> [batch_size] [decode_threads] [tone_workers]
+
+A manifest is a .txt file with one image path per line, or a .csv file
+with a "file" column; relative paths are relative to the manifest.
+Images are decoded and prepared on a thread pool a few batches ahead,
+classified by both CNNs one batch at a time, and their skin tone is
+detected on a process pool while the CNNs run. Rows of
+{file, type, acne, tone, error, timings} are written as each batch
+finishes: appended to a CSV file, or as one part file per batch in a
+Parquet dataset directory (needs pyarrow). The output doubles as the
+checkpoint - rerunning the same command skips files already analyzed
+without an error; failed files are retried and written again, so the
+last row for a file is the current one.
+"""
+
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from tone_pool import TonePool
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+COLUMNS = ['file', 'type', 'acne', 'tone', 'error', 'timings']
+SKIN_TONE_DATASET = 'models/skin_tone/skin_tone_dataset.csv'
+# Batches decoded ahead of the one being classified
+PREFETCH_BATCHES = 2
+
+
+# Image paths of a directory (recursive), a glob pattern or a manifest file
+def list_images(source):
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+        return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+    if os.path.isfile(source) and source.lower().endswith(('.txt', '.csv')):
+        base = os.path.dirname(source)
+        with open(source, newline='') as f:
+            if source.lower().endswith('.csv'):
+                paths = [row['file'] for row in csv.DictReader(f)]
+            else:
+                paths = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        return [os.path.join(base, p) for p in paths]
+    return sorted(glob.glob(source, recursive=True))
+
+
+class CSVWriter:
+    """Appends rows to one CSV file, flushed after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def done(self):
+        if not os.path.exists(self.path):
+            return set()
+        self.drop_partial_line()
+        with open(self.path, newline='') as f:
+            return {row['file'] for row in csv.DictReader(f) if not row['error']}
+
+    # A run killed mid-write can leave a torn last line
+    def drop_partial_line(self):
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def write(self, rows):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, COLUMNS)
+            if new:
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetWriter:
+    """Writes each batch as its own part file of a Parquet dataset directory."""
+
+    def __init__(self, path):
+        from pandas.io.parquet import get_engine
+
+        get_engine('auto')  # fail before any work if pyarrow/fastparquet is missing
+        self.path = path
+
+    def parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def done(self):
+        import pandas as pd
+
+        done = set()
+        for part in self.parts():
+            rows = pd.read_parquet(part, columns=['file', 'error'])
+            done.update(rows.loc[rows['error'].isna(), 'file'])
+        return done
+
+    def write(self, rows):
+        import pandas as pd
+
+        os.makedirs(self.path, exist_ok=True)
+        parts = self.parts()
+        index = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+        out = os.path.join(self.path, f'part-{index:05d}.parquet')
+        # written under a temporary name so a killed run never leaves half a part
+        tmp_path = f'{out}.{os.getpid()}.tmp'
+        pd.DataFrame(rows, columns=COLUMNS).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, out)
+
+
+def make_writer(path):
+    return ParquetWriter(path) if path.lower().endswith('.parquet') else CSVWriter(path)
+
+
+# Decode thread: the prepared arrays of one image, or the error opening it
+def decode(path):
+    from PIL import Image
+    from preprocessing import prepare_image
+
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as im:
+            prepared = prepare_image(im)
+        return path, prepared, None, time.perf_counter() - start
+    except Exception as e:
+        return path, None, f"decode: {e}", time.perf_counter() - start
+
+
+# Submit decodes up to `ahead` images in front of the consumer, yield in order
+def prefetch(pool, fn, items, ahead):
+    items = iter(items)
+    pending = deque(pool.submit(fn, item) for item in islice(items, ahead))
+    while pending:
+        result = pending.popleft().result()
+        pending.extend(pool.submit(fn, item) for item in islice(items, 1))
+        yield result
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_models():
+    os.environ.setdefault('STARTUP_MODE', 'lazy')
+    import app
+
+    app.require('models')
+    if app.model1 is None or app.model2 is None:
+        raise SystemExit("skin or acne model not loaded, see the errors above")
+    return app
+
+
+def analyze_batch(source, out, batch_size=16, decode_threads=4, tone_workers=None):
+    writer = make_writer(out)
+    done = writer.done()
+    paths = [p for p in list_images(source) if p not in done]
+    print(f"{len(paths)} images to analyze ({len(done)} already in {out})")
+    if not paths:
+        return
+
+    # started before TensorFlow loads; its workers are spawned, never forked.
+    # Two batches of slots, so submitting a batch never waits on the previous one
+    tone_pool = TonePool(SKIN_TONE_DATASET, tone_workers, slots=2 * batch_size)
+    tone_pool.start()
+    try:
+        app = load_models()
+        start, count = time.perf_counter(), 0
+        with ThreadPoolExecutor(decode_threads, thread_name_prefix='decode') as decode_pool:
+            decoded = prefetch(decode_pool, decode, paths, batch_size * PREFETCH_BATCHES)
+            for batch in batches(decoded, batch_size):
+                ok = [item for item in batch if item[1] is not None]
+                tones = [tone_pool.submit(prepared["BGR"]) for _, prepared, _, _ in ok]
+                predictions = {}
+                if ok:
+                    cnn_start = time.perf_counter()
+                    pred1, pred2 = app.fused_model(np.concatenate([prepared["tensor"] for _, prepared, _, _ in ok]))
+                    cnn_seconds = (time.perf_counter() - cnn_start) / len(ok)
+                    for (path, _, _, _), p1, p2, tone in zip(ok, pred1, pred2, tones):
+                        predictions[path] = (app.class_names1[np.argmax(p1)], app.class_names2[np.argmax(p2)], tone)
+
+                rows = []
+                for path, prepared, error, decode_seconds in batch:
+                    row = {'file': path, 'type': None, 'acne': None, 'tone': None, 'error': error}
+                    timings = {'decode': decode_seconds}
+                    if path in predictions:
+                        skin_type_raw, acne_type, tone = predictions[path]
+                        row.update(type=app.skin_type_mapping.get(skin_type_raw, 'Normal'), acne=acne_type)
+                        timings['skin_acne'] = cnn_seconds
+                        try:
+                            tone, stages = tone.result()
+                            timings.update(stages)
+                            row['tone'] = max(1, min(6, int(tone)))
+                        except Exception as e:
+                            row['error'] = f"tone: {e}"
+                    row['timings'] = json.dumps({k: round(v, 6) for k, v in timings.items()})
+                    rows.append(row)
+                writer.write(rows)
+                count += len(rows)
+                elapsed = time.perf_counter() - start
+                print(f"{count}/{len(paths)} images, {count / elapsed:.1f} images/s")
+    finally:
+        tone_pool.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python batch_analyze.py <dir|glob|manifest> <out.csv|out.parquet> "
+              "[batch_size] [decode_threads] [tone_workers]")
+        sys.exit(1)
+    analyze_batch(sys.argv[1], sys.argv[2], *[int(arg) for arg in sys.argv[3:]])
@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks for the request pipeline.
+Run from backend/: python benchmarks.py <name> [image]
+"""
+
+import glob
+import os
+import sys
+import time
+import timeit
+
+DEFAULT_IMAGE = './static/image.png'
+SKIN_MODEL = './models/skin_model/skin_model.keras'
+ACNE_MODEL = './models/acne_model/acne_model.keras'
+TEST_IMAGES = '../ML/Skin_metrics/Skin_tone/public/test images'
+
+
+def bench(label, fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(f"{label:<32} {seconds * 1000:10.3f} ms")
+    return seconds
+
+
+def skin_predict(img_path=DEFAULT_IMAGE):
+    from models.skin_tone import skin_detection as sd
+
+    images = sd.image_conversions(sd.read_image(img_path))
+    loop = bench("skin_predict_loop", lambda: sd.skin_predict_loop(dict(images)), 1)
+    fast = bench("skin_predict", lambda: sd.skin_predict(dict(images)), 200)
+    print(f"speedup: {loop / fast:.0f}x")
+
+
+# How often an approximate clustering engine picks a different skin centroid
+# than the exact path. A centroid "differs" when it is more than `tolerance`
+# away (euclidean, H/Cr/Cb units) from the exact one.
+def cluster_engines(image_dir=TEST_IMAGES, tolerance=2.0):
+    import numpy as np
+    from models.skin_tone import skin_detection as sd
+
+    tolerance = float(tolerance)
+    paths = sorted(glob.glob(os.path.join(image_dir, '*')))
+    features = []
+    for path in paths:
+        images = sd.image_conversions(sd.read_image(path))
+        sd.skin_predict(images)
+        all_features, keep = sd.feature_matrix(images)
+        features.append(all_features[keep])
+
+    def run(engine, sample_size=None):
+        rows, seconds = [], 0.0
+        for f in features:
+            start = time.perf_counter()
+            rows.append(sd.cluster_skin(f, engine, sample_size)[0][:-1])
+            seconds += time.perf_counter() - start
+        return rows, seconds / len(features)
+
+    exact, exact_s = run("exact")
+    print(f"{'engine':<12}{'sample':>8}{'ms/image':>10}{'differs':>10}{'max dist':>10}")
+    print(f"{'exact':<12}{'-':>8}{exact_s * 1000:10.1f}{'-':>10}{'-':>10}")
+    for engine in ("subsample", "minibatch"):
+        for sample_size in (2048, 8192, 32768):
+            rows, seconds = run(engine, sample_size)
+            dist = [float(np.linalg.norm(a - b)) for a, b in zip(rows, exact)]
+            differs = sum(d > tolerance for d in dist)
+            print(f"{engine:<12}{sample_size:>8}{seconds * 1000:10.1f}"
+                  f"{f'{differs}/{len(dist)}':>10}{max(dist):10.2f}")
+
+
+# Two Keras predict() calls vs one fused tf.function call per image
+def inference(skin_model=SKIN_MODEL, acne_model=ACNE_MODEL):
+    import numpy as np
+    from tensorflow.keras.models import load_model
+    from inference import FusedModel
+
+    model1, model2 = load_model(skin_model), load_model(acne_model)
+    fused = FusedModel(model1, model2)
+    batch = np.random.default_rng(0).random((1, 224, 224, 3), dtype=np.float32)
+    fused(batch)
+    pred1, pred2 = fused(batch)
+    assert np.argmax(pred1) == np.argmax(model1.predict(batch, verbose=0))
+    assert np.argmax(pred2) == np.argmax(model2.predict(batch, verbose=0))
+    separate = bench("predict() x2", lambda: (model1.predict(batch, verbose=0),
+                                              model2.predict(batch, verbose=0)), 20)
+    on_batch = bench("predict_on_batch() x2", lambda: (model1.predict_on_batch(batch),
+                                                       model2.predict_on_batch(batch)), 20)
+    single = bench("FusedModel", lambda: fused(batch), 20)
+    print(f"speedup vs predict(): {separate / single:.1f}x, vs predict_on_batch(): {on_batch / single:.1f}x")
+
+
+# Throughput of concurrent single-image calls with and without MicroBatcher
+def batching(skin_model=SKIN_MODEL, acne_model=ACNE_MODEL, clients=16, requests=256):
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from tensorflow.keras.models import load_model
+    from inference import FusedModel, MicroBatcher
+
+    clients, requests = int(clients), int(requests)
+    fused = FusedModel(load_model(skin_model), load_model(acne_model))
+    batcher = MicroBatcher(fused, max_batch=clients, max_wait_ms=5)
+    images = np.random.default_rng(0).random((requests, 1, 224, 224, 3), dtype=np.float32)
+    expected = [fused(image) for image in images]
+
+    for label, model in (("FusedModel", fused), ("MicroBatcher", batcher)):
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(model, images))  # warm-up: first batch of each size pays kernel setup
+            start = time.perf_counter()
+            results = list(pool.map(model, images))
+            elapsed = time.perf_counter() - start
+        for got, want in zip(results, expected):
+            assert all(np.allclose(g, w, atol=1e-5) for g, w in zip(got, want))
+        print(f"{label:<14} {requests / elapsed:8.1f} images/s")
+    stats = batcher.stats()
+    print(f"batch sizes {stats['batch_sizes']}, mean batch size {stats['mean_batch_size']:.1f}, "
+          f"mean queue wait {stats['queue_wait_seconds_total'] / stats['images'] * 1000:.2f} ms, "
+          f"mean batch latency {stats['batch_seconds_total'] / stats['batches'] * 1000:.2f} ms")
+
+
+# Time from process start to the first 200 on / and on /health/ready, per
+# STARTUP_MODE, then the slowest imports app.py makes directly (-X importtime)
+def cold_start(modes="eager,background,lazy", port=5099):
+    import subprocess
+    import urllib.error
+    import urllib.request
+
+    def wait_for(url, proc, timeout=300):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline and proc.poll() is None:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"{url} not ready")
+
+    server = f"import app; app.app.run(host='127.0.0.1', port={int(port)})"
+    print(f"{'mode':<12}{'first / (s)':>12}{'ready (s)':>12}")
+    for mode in modes.split(","):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-c", server], env=dict(os.environ, STARTUP_MODE=mode),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(f"http://127.0.0.1:{port}/", proc)
+            first = time.perf_counter() - start
+            # lazy mode only becomes ready once requests have needed every component
+            ready = "-"
+            if mode != "lazy":
+                wait_for(f"http://127.0.0.1:{port}/health/ready", proc)
+                ready = f"{time.perf_counter() - start:.2f}"
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"{mode:<12}{first:12.2f}{ready:>12}")
+
+    # background imports the same as lazy, plus a warm-up thread racing the profile
+    for mode in [m for m in modes.split(",") if m != "background"]:
+        profile = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True,
+                                 text=True, env=dict(os.environ, STARTUP_MODE=mode)).stderr
+        imports = []
+        for line in profile.splitlines():
+            parts = line.split("|")
+            if line.startswith("import time:") and len(parts) == 3 and parts[2].startswith("   ") \
+                    and not parts[2].startswith("    "):
+                imports.append((int(parts[1]), parts[2].strip()))
+        total = next(int(l.split("|")[1]) for l in profile.splitlines() if l.rstrip().endswith("| app"))
+        top = ", ".join(f"{name} {us / 1e6:.2f}s" for us, name in sorted(imports, reverse=True)[:5])
+        print(f"import app ({mode}): {total / 1e6:.2f}s - {top}")
+
+
+# Decode-and-prepare time and peak RSS of prepare_image on camera-sized
+# JPEGs, decoding at full size vs. draft (reduced) size. Each run is a
+# fresh process so its peak RSS (VmHWM) is its own.
+DECODE_PROBE = """
+import io, sys, time
+from PIL import Image
+from preprocessing import prepare_image
+path, reduce = sys.argv[1], sys.argv[2] == '1'
+data = open(path, 'rb').read()
+times = []
+for _ in range(5):
+    start = time.perf_counter()
+    prepare_image(Image.open(io.BytesIO(data)), reduce)
+    times.append(time.perf_counter() - start)
+print(min(times), next(l.split()[1] for l in open('/proc/self/status') if l.startswith('VmHWM')))
+"""
+
+
+def decode(img_path=DEFAULT_IMAGE, megapixels="1,3,12,48"):
+    import subprocess
+    import tempfile
+    from PIL import Image
+
+    source = Image.open(img_path).convert("RGB")
+    print(f"{'size':<12}{'full ms':>10}{'draft ms':>10}{'full MiB':>10}{'draft MiB':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in megapixels.split(","):
+            width = int((float(mp) * 1e6 * 3 / 4) ** 0.5)
+            path = os.path.join(tmp, f"{mp}mp.jpg")
+            source.resize((width, width * 4 // 3)).save(path, "JPEG", quality=90)
+            results = []
+            for reduce in ("0", "1"):
+                out = subprocess.run([sys.executable, "-c", DECODE_PROBE, path, reduce],
+                                     capture_output=True, text=True, check=True).stdout.split()
+                results.append((float(out[0]) * 1000, int(out[1]) / 1024))
+            (full_ms, full_mib), (draft_ms, draft_mib) = results
+            print(f"{mp + ' MP':<12}{full_ms:10.1f}{draft_ms:10.1f}{full_mib:10.0f}{draft_mib:11.0f}")
+
+
+# Cost of the per-request instrumentation (stage and request histograms, the
+# log sampling decision and one INFO line) against an uncached analysis,
+# here just its skin tone stages, checked against metrics.OVERHEAD_BUDGET
+def instrumentation(img_path=DEFAULT_IMAGE, sample_rate="0.1"):
+    import logging
+    import random
+    import logs
+    import metrics
+    from models.skin_tone import skin_detection as sd
+    from models.skin_tone.skin_tone_knn import identify_skin_tone
+
+    dataset = './models/skin_tone/skin_tone_dataset.csv'
+    image = sd.read_image(img_path)
+    timings = {}
+    identify_skin_tone(image, dataset, timings=timings)
+    timings.update(decode=0.01, skin_acne=0.05, tone=0.1, total=0.1)
+
+    histogram = metrics.Histogram("bench_seconds", "benchmark", "stage")
+    request_observe = bench("Histogram.observe", lambda: histogram.observe("decode", random.random()), 100000)
+
+    def timed_block():
+        with metrics.timer("bench"):
+            pass
+    timer = bench("timer", timed_block, 100000)
+    observe = bench(f"observe_stages ({len(timings)} stages)", lambda: metrics.observe_stages(timings), 20000)
+
+    log = logging.getLogger("bench")
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.addFilter(logs.SampledFilter())
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    logs.LOG_SAMPLE_RATE = float(sample_rate)
+
+    def log_request():
+        logs.sample_request()
+        log.info("upload: type %s, tone %s, acne %s (%s)", "Dry_skin", 3, "Low", timings)
+    logged = bench(f"sampled log line (rate {sample_rate})", log_request, 20000)
+    logs.LOG_SAMPLE_RATE = 1.0
+    logged_all = bench("log line (rate 1)", log_request, 20000)
+
+    request = bench("identify_skin_tone", lambda: identify_skin_tone(image, dataset), 3)
+    # decode timer, the request histogram and the analysis stages, plus logging
+    metered = timer + request_observe + observe
+    for label, cost in ((f"rate {sample_rate}", metered + logged), ("rate 1", metered + logged_all)):
+        share = cost / request
+        verdict = "within" if share <= metrics.OVERHEAD_BUDGET else "OVER"
+        print(f"overhead, logging at {label}: {cost * 1e6:.1f} us/request = {share:.3%} "
+              f"of the tone stages, {verdict} the {metrics.OVERHEAD_BUDGET:.1%} budget")
+
+
+BENCHMARKS = {
+    "skin_predict": skin_predict,
+    "cluster_engines": cluster_engines,
+    "inference": inference,
+    "batching": batching,
+    "cold_start": cold_start,
+    "decode": decode,
+    "instrumentation": instrumentation,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"usage: python benchmarks.py {{{','.join(BENCHMARKS)}}} [image]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,152 @@
+"""
+Small result caches shared by the API routes.
+LRUCache lives in the worker process; SQLiteCache keeps entries in a local
+SQLite file so every gunicorn worker on the host shares the same hits.
+Both evict least-recently-used entries past `maxsize`, expire entries
+after `ttl` seconds and count hits, misses and evictions.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, size=len(self.entries), maxsize=self.maxsize, ttl=self.ttl)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.
+        return stats
+
+
+class SQLiteCache(LRUCache):
+    """
+    Values must be JSON serializable. Counters are per process.
+    A hit refreshes the entry's LRU time only if it is older than
+    `touch_interval` seconds, so hot keys do not turn every read into a
+    write on SQLite's single write lock. A database error (e.g. "database
+    is locked") makes get() a miss and set() a no-op, counted as "errors".
+    """
+
+    touch_interval = 10.
+
+    def __init__(self, path, maxsize=4096, ttl=3600):
+        super().__init__(maxsize, ttl)
+        self.counters["errors"] = 0
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS cache "
+                       "(key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    # one connection per thread and process - sqlite connections are not shareable
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def get(self, key):
+        now = time.time()
+        row = None
+        try:
+            db = self.connect()
+            row = db.execute("SELECT value, expires, used FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] < now:
+                self.count("expirations")
+                row = None
+                with db:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            elif row is not None and now - row[2] > self.touch_interval:
+                with db:
+                    db.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            # a failed read is a miss; a failed delete or LRU touch keeps what was read
+            self.count("errors")
+        if row is None:
+            self.count("misses")
+            return None
+        self.count("hits")
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            db = self.connect()
+            with db:
+                db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                           (key, json.dumps(value), now + self.ttl, now))
+                evicted = db.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,)).rowcount
+        except sqlite3.Error:
+            self.count("errors")
+            return
+        if evicted:
+            self.count("evictions", evicted)
+
+    def clear(self):
+        with self.connect() as db:
+            db.execute("DELETE FROM cache")
+
+    def stats(self):
+        stats = super().stats()
+        stats["size"] = self.connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        stats["path"] = self.path
+        return stats
+
+
+# SQLiteCache when `path` is set, otherwise a per-process LRUCache
+def make_cache(path=None, maxsize=4096, ttl=3600):
+    if path:
+        return SQLiteCache(path, maxsize, ttl)
+    return LRUCache(maxsize, ttl)
@@ -0,0 +1,122 @@
+"""
+Export the skin type and acne classifiers to TFLite, and compare the
+TFLite backend (MODEL_BACKEND=tflite) against the Keras one.
+
+Run from backend/:
+  python export_tflite.py export [none|float16|int8]
+  python export_tflite.py report [image dir]
+
+int8 quantization calibrates on the test images through prepare_image,
+so the representative data matches what the app feeds the models.
+The report prints class agreement, per-image latency and the peak RSS
+of a fresh process that loads each backend and classifies one image.
+"""
+
+import glob
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+MODELS = {
+    'skin': './models/skin_model/skin_model.keras',
+    'acne': './models/acne_model/acne_model.keras',
+}
+TEST_IMAGES = '../ML/Skin_metrics/Skin_tone/public/test images'
+QUANTIZATIONS = ('none', 'float16', 'int8')
+
+
+def tflite_path(keras_path):
+    return os.path.splitext(keras_path)[0] + '.tflite'
+
+
+def image_tensors(image_dir=TEST_IMAGES, limit=None):
+    from preprocessing import prepare_image
+
+    paths = sorted(glob.glob(os.path.join(image_dir, '*')))[:limit]
+    return [prepare_image(Image.open(path).convert('RGB'))['tensor'] for path in paths]
+
+
+def convert(keras_path, quantize='none', image_dir=TEST_IMAGES):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(keras_path))
+    if quantize == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        tensors = image_tensors(image_dir, limit=100)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([t] for t in tensors)
+    return converter.convert()
+
+
+def export(quantize='none', image_dir=TEST_IMAGES):
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"quantize must be one of {QUANTIZATIONS}")
+    for name, keras_path in MODELS.items():
+        start = time.perf_counter()
+        data = convert(keras_path, quantize, image_dir)
+        out = tflite_path(keras_path)
+        with open(out, 'wb') as f:
+            f.write(data)
+        print(f"{name}: wrote {out} ({quantize}, {len(data) / 2**20:.1f} MiB, "
+              f"keras {os.path.getsize(keras_path) / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f}s")
+
+
+# Peak RSS of a process that only loads one backend and classifies once
+# (VmHWM, since ru_maxrss would carry over this process's peak across exec)
+RSS_PROBE = """
+import sys, numpy as np
+backend, path = sys.argv[1:]
+if backend == 'tflite':
+    from inference import TFLiteModel
+    model = TFLiteModel(path)
+else:
+    from tensorflow.keras.models import load_model
+    model = load_model(path)
+model.predict_on_batch(np.zeros((1, 224, 224, 3), np.float32))
+print(next(l.split()[1] for l in open('/proc/self/status') if l.startswith('VmHWM')))
+"""
+
+
+def peak_rss_mib(backend, path):
+    out = subprocess.run([sys.executable, '-c', RSS_PROBE, backend, path],
+                         capture_output=True, text=True, check=True).stdout
+    return int(out.split()[-1]) / 1024
+
+
+def report(image_dir=TEST_IMAGES):
+    from tensorflow.keras.models import load_model
+    from inference import TFLiteModel
+
+    tensors = image_tensors(image_dir)
+    print(f"{len(tensors)} images from {image_dir}")
+    print(f"{'model':<6}{'agree':>8}{'max |dp|':>10}{'keras ms':>10}{'tflite ms':>11}{'keras MiB':>11}{'tflite MiB':>12}")
+    for name, keras_path in MODELS.items():
+        keras_model, lite_model = load_model(keras_path), TFLiteModel(tflite_path(keras_path))
+        timings = {}
+        outputs = {}
+        for backend, model in (('keras', keras_model), ('tflite', lite_model)):
+            model.predict_on_batch(tensors[0])
+            start = time.perf_counter()
+            outputs[backend] = np.concatenate([model.predict_on_batch(t) for t in tensors])
+            timings[backend] = (time.perf_counter() - start) / len(tensors)
+        agree = np.mean(outputs['keras'].argmax(1) == outputs['tflite'].argmax(1))
+        max_diff = np.abs(outputs['keras'] - outputs['tflite']).max()
+        print(f"{name:<6}{agree:8.1%}{max_diff:10.4f}{timings['keras'] * 1000:10.2f}{timings['tflite'] * 1000:11.2f}"
+              f"{peak_rss_mib('keras', keras_path):11.0f}{peak_rss_mib('tflite', tflite_path(keras_path)):12.0f}")
+
+
+COMMANDS = {
+    'export': export,
+    'report': report,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"usage: python export_tflite.py {{{','.join(COMMANDS)}}} [args]")
+        sys.exit(1)
+    COMMANDS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,61 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn runs from backend/:
+
+    gunicorn app:app
+
+With preloading (the default, GUNICORN_PRELOAD=0 to disable) the master
+imports app.py once - in the default eager mode that loads OpenCV,
+scikit-learn, the recommender tables and the skin tone classifier - and
+forks the workers, which start out sharing those pages copy-on-write.
+TensorFlow is never imported in the master: it deadlocks in a child
+forked from a process that already ran TF ops, so each worker loads the
+models itself after the fork. With STARTUP_MODE=background each worker
+loads everything on its warm-up thread (and /health/ready answers 503
+until it is done); with STARTUP_MODE=lazy components load on first use.
+
+Every worker logs its resident (RSS) and private (USS) memory once ready;
+USS is what each extra worker actually costs.
+"""
+
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+if preload_app:
+    os.environ['DEFER_MODEL_LOAD'] = '1'
+
+
+# RSS and USS in MiB, from /proc/self/smaps_rollup (Linux only)
+def memory_report():
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return "memory report unavailable"
+    uss = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return f"rss={fields.get('Rss', 0):.0f}MiB uss={uss:.0f}MiB pss={fields.get('Pss', 0):.0f}MiB"
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.freeze_shared_state()
+    server.log.info(f"master ready (preload={preload_app}): {memory_report()}")
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        if app.tone_pool is not None:
+            app.tone_pool.start()
+        if app.startup_mode == 'eager':
+            app.require('models')
+        elif app.startup_mode == 'background':
+            app.start_warm_up()
+
+
+def post_worker_init(worker):
+    worker.log.info(f"worker {worker.pid} ready: {memory_report()}")
@@ -0,0 +1,204 @@
+"""
+Fused inference for the skin type and acne classifiers.
+Both models run inside one traced tf.function, so a request pays the
+graph dispatch overhead once instead of two Keras predict() calls.
+TFLiteModel/LiteModels are the same contract on a TFLite interpreter,
+without loading TensorFlow when a standalone runtime is installed.
+MicroBatcher optionally coalesces concurrent requests into one batch.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+MODEL_INPUT_SHAPE = (224, 224, 3)
+
+
+class FusedModel:
+    """
+    Runs every loaded model on the same input batch in one call.
+    Returns one numpy array of class scores per model, in the order the
+    models were given, with None in place of a model that is not loaded.
+    """
+
+    def __init__(self, *models):
+        import tensorflow as tf
+
+        self.models = models
+        self.loaded = [m for m in models if m is not None]
+        self.graph = tf.function(
+            self.run,
+            input_signature=[tf.TensorSpec((None,) + MODEL_INPUT_SHAPE, tf.float32)],
+            reduce_retracing=True,
+        )
+
+    def run(self, batch):
+        return [m(batch, training=False) for m in self.loaded]
+
+    def __call__(self, batch):
+        outputs = iter(self.graph(np.asarray(batch, dtype=np.float32)) if self.loaded else [])
+        return [None if m is None else next(outputs).numpy() for m in self.models]
+
+
+# TFLite interpreter class: LiteRT or tflite-runtime if installed, else TensorFlow's
+def lite_interpreter():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    A .tflite classifier with the Keras calls the app uses
+    (predict_on_batch and __call__). Interpreters are not thread-safe,
+    so calls are serialized; (de)quantizes int8 inputs/outputs if needed.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.interpreter = lite_interpreter()(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        self.lock = threading.Lock()
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self.lock:
+            if len(batch) != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+            scale, zero_point = self.input['quantization']
+            if scale:
+                batch = np.round(batch / scale + zero_point).astype(self.input['dtype'])
+            self.interpreter.set_tensor(self.input['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output['index'])
+        scale, zero_point = self.output['quantization']
+        if scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def __call__(self, batch, training=False):
+        return self.predict_on_batch(batch)
+
+
+class LiteModels:
+    """FusedModel's contract for TFLiteModel instances, one invoke per model."""
+
+    def __init__(self, *models):
+        self.models = models
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return [None if m is None else m.predict_on_batch(batch) for m in self.models]
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent inference calls into one batch.
+    A background thread takes the first queued tensor, then waits up to
+    max_wait_ms for more until max_batch images are collected, runs them
+    through `model` in one call and hands each caller its own slice of
+    the outputs through a Future. Calling the batcher has the same
+    signature and result as calling `model` directly.
+    """
+
+    def __init__(self, model, max_batch=8, max_wait_ms=5):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.metrics = {
+            "batches": 0,
+            "images": 0,
+            "batch_sizes": {},
+            "queue_wait_seconds_total": 0.,
+            "queue_wait_seconds_max": 0.,
+            "batch_seconds_total": 0.,
+            "batch_seconds_last": 0.,
+        }
+
+    def submit(self, batch):
+        # started lazily so a batcher created before a fork still works in the child
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.loop, name="micro-batcher", daemon=True)
+                    self.thread.start()
+        future = Future()
+        self.queue.put((np.asarray(batch, dtype=np.float32), future, time.perf_counter()))
+        return future
+
+    def __call__(self, batch):
+        return self.submit(batch).result()
+
+    def collect(self):
+        items = [self.queue.get()]
+        size = len(items[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    def loop(self):
+        while True:
+            items = self.collect()
+            start = time.perf_counter()
+            try:
+                batch = np.concatenate([tensor for tensor, _, _ in items])
+                outputs = self.model(batch)
+            except Exception as e:
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            offset = 0
+            for tensor, future, _ in items:
+                end = offset + len(tensor)
+                future.set_result([None if out is None else out[offset:end] for out in outputs])
+                offset = end
+            self.record(items, start, elapsed)
+
+    def record(self, items, start, elapsed):
+        waits = [start - queued for _, _, queued in items]
+        size = sum(len(tensor) for tensor, _, _ in items)
+        m = self.metrics
+        with self.lock:
+            m["batches"] += 1
+            m["images"] += size
+            m["batch_sizes"][size] = m["batch_sizes"].get(size, 0) + 1
+            m["queue_wait_seconds_total"] += sum(waits)
+            m["queue_wait_seconds_max"] = max(m["queue_wait_seconds_max"], max(waits))
+            m["batch_seconds_total"] += elapsed
+            m["batch_seconds_last"] = elapsed
+
+    def stats(self):
+        # under the lock: record() adds batch_sizes keys from the batching thread
+        with self.lock:
+            m = dict(self.metrics, batch_sizes=dict(self.metrics["batch_sizes"]))
+        m["max_batch"] = self.max_batch
+        m["max_wait_ms"] = self.max_wait * 1000.
+        m["queue_depth"] = self.queue.qsize()
+        m["mean_batch_size"] = m["images"] / m["batches"] if m["batches"] else 0.
+        return m
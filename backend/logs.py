@@ -0,0 +1,41 @@
+"""
+Leveled, sampled logging for the backend.
+
+LOG_LEVEL (default INFO) sets the level; the per-request debugging that
+used to be printed on every upload is at DEBUG. LOG_SAMPLE_RATE (default
+1) keeps that fraction of requests' records below WARNING, decided once
+per request so a sampled request logs all its lines; warnings and errors
+are always kept.
+"""
+
+import contextvars
+import logging
+import os
+import random
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1))
+
+# False while serving a request that was not sampled
+request_sampled = contextvars.ContextVar('request_sampled', default=True)
+
+
+class SampledFilter(logging.Filter):
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or request_sampled.get()
+
+
+def sample_request():
+    request_sampled.set(LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE)
+
+
+def get_logger(name='sayskin'):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+        handler.addFilter(SampledFilter())
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
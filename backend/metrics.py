@@ -0,0 +1,84 @@
+"""
+Latency histograms for the analysis pipeline, served in the Prometheus
+text format on /metrics.
+
+Stage timings are collected into the same {stage: seconds} dicts that feed
+the Server-Timing header (see app.timed) and observed once per request, or
+with `with timer(stage):` around a single call. An observation is a bisect
+and a locked list update; `python benchmarks.py instrumentation` checks
+the per-request cost against OVERHEAD_BUDGET.
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds, from a cached lookup up to a slow cold analysis
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Largest share of a request's time the instrumentation may add
+OVERHEAD_BUDGET = 0.005
+
+
+class Histogram:
+    """A Prometheus histogram with one label, e.g. stage="skin_predict"."""
+
+    def __init__(self, name, documentation, label, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(value)
+            if series is None:
+                series = self.series[value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        with self.lock:
+            snapshot = {value: (list(counts), total) for value, (counts, total) in self.series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        for value, (counts, total) in sorted(snapshot.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("sayskin_stage_seconds", "Duration of each analysis and recommendation stage.", "stage")
+request_seconds = Histogram("sayskin_request_seconds", "Request duration by route.", "route")
+
+
+def observe_stages(timings):
+    for stage, seconds in timings.items():
+        stage_seconds.observe(stage, seconds)
+
+
+class timer:
+    """with timer("decode"): ... observes the block's wall time."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_seconds.observe(self.stage, time.perf_counter() - self.start)
+
+
+def render():
+    return "\n".join(stage_seconds.render() + request_seconds.render()) + "\n"
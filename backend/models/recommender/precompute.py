@@ -0,0 +1,57 @@
+"""
+Precompute recs_essentials for every possible 0/1 feature vector.
+Writes a (2**len(features), len(LABELS), count) uint16 table of product
+row indices; row `mask` holds the answer for the vector whose bit i is
+features[i], plus a .version file with the data_version of the CSVs it
+was built from. rec.py memory-maps the table read-only, so all workers
+share its pages and /recommend becomes one array lookup; a table built
+from other CSVs is ignored.
+
+Run from backend/: python -m models.recommender.precompute [out.npy]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from models.recommender import rec
+
+CHUNK = 4096
+
+
+# Same ranking as rec.recommend: key descending, ties in catalogue order
+def build_table(count=rec.RECS_COUNT):
+    n_vectors = 2 ** len(rec.features)
+    table = np.empty((n_vectors, len(rec.LABELS), count), dtype=np.uint16)
+    bits = 1 << np.arange(len(rec.features))
+    encodings = rec.one_hot_encodings.astype(np.float64)
+    for start in range(0, n_vectors, CHUNK):
+        masks = np.arange(start, min(start + CHUNK, n_vectors))
+        vectors = ((masks[:, None] & bits) > 0).astype(np.float64)
+        dot = vectors @ encodings.T
+        key = np.zeros_like(dot)
+        np.divide(dot * np.abs(dot), rec.row_sq_norms, out=key, where=rec.row_sq_norms > 0)
+        for l, label in enumerate(rec.LABELS):
+            idx = rec.label_index[label]
+            order = np.argsort(-key[:, idx], axis=1, kind='stable')[:, :count]
+            table[masks, l] = idx[order]
+    return table
+
+
+def main(out=None):
+    out = out or rec.recs_table_path()
+    start = time.perf_counter()
+    table = build_table()
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    tmp_path = f'{out}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp_path, out)
+    with open(tmp_path, 'w') as f:
+        f.write(rec.data_version)
+    os.replace(tmp_path, rec.recs_table_version_path(out))
+    print(f"wrote {out}: {table.shape} {table.nbytes / 2**20:.1f} MiB in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -1,6 +1,8 @@
+import hashlib
+import os
+import random
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 
 df2 = pd.read_csv('./models/recommender/final.csv')
 makeup = pd.read_csv('./models/recommender/makeup_final.csv')
@@ -52,52 +54,156 @@ def wrap_makeup(info_arr):
     result['skin tone'] = info_arr[6]
     return result
 
-one_hot_encodings = np.zeros([entries, len(features)])
+ONE_HOT_CACHE_DIR = './models/recommender/.cache'
 
 
-#skin types first
-for i in range(entries):
+def build_one_hot(df):
+    encodings = np.zeros([len(df), len(features)], dtype=np.uint8)
+
+    #skin types first - 'all' covers the first five columns
+    sk_type = df['skin type'].values
     for j in range(5):
-        target = features[j]
-        sk_type = df2.iloc[i]['skin type']
-        if sk_type == 'all':
-            one_hot_encodings[i][0:5] = 1
-        elif target == sk_type:
-            one_hot_encodings[i][j] = 1
-
-#other features
-for i in range(entries):
+        encodings[:, j] = sk_type == features[j]
+    encodings[sk_type == 'all', 0:5] = 1
+
+    #other features - substring match on the concern list
+    concern = df['concern'].astype(str)
     for j in range(5, len(features)):
-        feature = features[j]
-        if feature in df2.iloc[i]['concern']:
-            one_hot_encodings[i][j] = 1
+        encodings[:, j] = concern.str.contains(features[j], regex=False).values
+    return encodings
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# one-hot matrix cached as .npy, keyed by a hash of the CSV and the feature list
+def load_one_hot(csv_path, df):
+    digest = hashlib.sha1(file_digest(csv_path).encode())
+    digest.update('\0'.join(features).encode())
+    cache_path = os.path.join(ONE_HOT_CACHE_DIR, f'one_hot_{digest.hexdigest()}.npy')
+    try:
+        return np.load(cache_path)
+    except (OSError, ValueError):
+        pass
+    encodings = build_one_hot(df)
+    try:
+        os.makedirs(ONE_HOT_CACHE_DIR, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, encodings)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # read-only deploys just rebuild on every start
+    return encodings
+
+
+one_hot_encodings = load_one_hot('./models/recommender/final.csv', df2)
+
+# changes whenever final.csv or makeup_final.csv change - used to key response caches
+data_version = hashlib.sha1((file_digest('./models/recommender/final.csv') +
+                             file_digest('./models/recommender/makeup_final.csv')).encode()).hexdigest()[:16]
+
+# precomputed scoring tables - read-only after import, shared by all requests
+
+row_sq_norms = (one_hot_encodings ** 2).sum(axis=1)
+label_index = {label: np.flatnonzero(df2['label'].values == label) for label in LABELS}
+product_names = df2['name'].to_numpy(dtype=object)
+product_data = df2[['brand', 'name', 'price', 'url', 'img', 'skin type', 'concern']].to_dict('split')['data']
+
+
+# similarity key for every product, in the same order as cosine similarity
+def similarity(fv):
+    # cos^2 = dot^2 / (|row|^2 * |fv|^2); |fv| is the same for every row, so
+    # sign(dot) * dot^2 / |row|^2 ranks rows exactly like the cosine, and
+    # rows with equal cosine get bit-identical keys
+    dot = one_hot_encodings @ np.asarray(fv, dtype=np.float64)
+    key = np.zeros(entries)
+    np.divide(dot * np.abs(dot), row_sq_norms, out=key, where=row_sq_norms > 0)
+    return key
+
+
+# indices of the top `count` rows by key, ties broken by catalogue order
+def top_k(idx, key, count):
+    scores = key[idx]
+    if len(idx) > count:
+        kth = np.partition(scores, len(idx) - count)[len(idx) - count]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[:count - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(len(idx))
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return idx[order]
+
+
+RECS_COUNT = 5
+
+
+def recommend(key, label=None, name=None, count=RECS_COUNT):
+    idx = label_index[label] if label else np.arange(entries)
+    if name:
+        idx = idx[product_names[idx] != name]
+    return [wrap(product_data[i]) for i in top_k(idx, key, count)]
+
+
+# mark the scoring tables read-only, so a stray in-place write from a request raises
+def freeze():
+    for array in [one_hot_encodings, row_sq_norms, product_names, *label_index.values()]:
+        array.setflags(write=False)
+
+
+# precomputed recs_essentials table (see precompute.py), memory-mapped read-only
+
+
+def recs_table_path():
+    return os.environ.get('RECS_TABLE_PATH', os.path.join(ONE_HOT_CACHE_DIR, f'recs_top{RECS_COUNT}_{data_version}.npy'))
+
+
+# data_version of the CSVs a table was built from, stored next to it
+def recs_table_version_path(path):
+    return f'{path}.version'
+
+
+def load_recs_table():
+    path = recs_table_path()
+    try:
+        with open(recs_table_version_path(path)) as f:
+            if f.read().strip() != data_version:
+                return None
+        table = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if table.shape != (2 ** len(features), len(LABELS), RECS_COUNT) or table.max() >= entries:
+        return None
+    return table
+
+
+recs_table = load_recs_table()
+
+
+# table row for a 0/1 feature vector, None when the table cannot answer it
+def table_row(vector):
+    if recs_table is None or vector is None or len(vector) != len(features):
+        return None
+    mask = 0
+    for i, value in enumerate(vector):
+        if value not in (0, 1):
+            return None
+        mask |= int(value) << i
+    return mask
+
 
 # recommend top 5 similar items from a category
 
 
-def recs_cs(vector = None, name = None, label = None, count = 5):
-    products = []
+def recs_cs(vector = None, name = None, label = None, count = RECS_COUNT):
     if name:
-        idx = name2index(name)
-        fv = one_hot_encodings[idx]
+        fv = one_hot_encodings[name2index(name)]
     elif vector:
         fv = vector
-    cs_values = cosine_similarity(np.array([fv, ]), one_hot_encodings)
-    df2['cs'] = cs_values[0]
-    
-    if label:
-        dff = df2[df2['label'] == label]
-    else:
-        dff = df2
-    
-    if name:
-        dff = dff[dff['name'] != name]
-    recommendations = dff.sort_values('cs', ascending=False).head(count)
-    #   print(f"Top {count} matching {label} items")
-    data = recommendations[['brand', 'name', 'price', 'url','img','skin type','concern']].to_dict('split')['data']
-    for element in data:
-        products.append(wrap(element))
-    return products
+    return recommend(similarity(fv), label, name, count)
 
     # overall recommendation
 
@@ -105,13 +211,18 @@ def recs_cs(vector = None, name = None, label = None, count = 5):
 def recs_essentials(vector = None, name = None):
 #     print("ESSENTIALS:")
     response = {}
+    mask = table_row(vector) if not name else None
+    if mask is not None:
+        for l, label in enumerate(LABELS):
+            response[label] = [wrap(product_data[i]) for i in recs_table[mask, l]]
+        return response
+    if name:
+        key = similarity(one_hot_encodings[name2index(name)])
+    elif vector:
+        key = similarity(vector)
     for label in LABELS:
 #         print(f"{label}:")
-        if name: 
-            r = recs_cs(None, name, label)
-        elif vector:
-            r = recs_cs(vector, None, label)
-        response[label] = r
+        response[label] = recommend(key, label, name)
     return response
 
 
@@ -143,20 +254,28 @@ def recs_essentials(vector = None, name = None):
         result.append(wrap_makeup(element))
     return result
 
-def makeup_recommendation(skin_tone, skin_type):
-    result = []
+MAKEUP_LABELS = ['foundation', 'concealer', 'primer']
+MAKEUP_PER_LABEL = 2
 
-    foundation_df = makeup[(makeup['skin tone'] == skin_tone) & (makeup['skin type'] == skin_type) & (makeup['label'] == 'foundation')].head(2)
-    concealer_df = makeup[(makeup['skin tone'] == skin_tone) & (makeup['skin type'] == skin_type) & (makeup['label'] == 'concealer')].head(2)
-    primer_df = makeup[(makeup['skin tone'] == skin_tone) & (makeup['skin type'] == skin_type) & (makeup['label'] == 'primer')].head(2)
 
-    dff = pd.concat([foundation_df, concealer_df, primer_df], ignore_index=True)
-    dff = dff.sample(frac=1)  # Shuffle
+# (skin tone, skin type, label) -> first two serialized products, built once
+def build_makeup_index(df):
+    index = {}
+    columns = ['skin tone', 'skin type', 'label', 'brand', 'name', 'price', 'url', 'img']
+    for tone, sk_type, label, *info in df[columns].itertuples(index=False):
+        products = index.setdefault((tone, sk_type, label), [])
+        if len(products) < MAKEUP_PER_LABEL:
+            products.append(wrap_makeup(info + [sk_type, tone]))
+    return index
 
-    data = dff[['brand', 'name', 'price', 'url', 'img', 'skin type', 'skin tone']].to_dict('split')['data']
-    for element in data:
-        result.append(wrap_makeup(element))
 
-    return result
+makeup_index = build_makeup_index(makeup)
 
 
+def makeup_recommendation(skin_tone, skin_type, shuffle=True, seed=None):
+    result = []
+    for label in MAKEUP_LABELS:
+        result.extend(dict(p) for p in makeup_index.get((skin_tone, skin_type, label), ()))
+    if shuffle:
+        (random if seed is None else random.Random(seed)).shuffle(result)
+    return result
@@ -1,5 +1,73 @@
-import rec
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from models.recommender import rec
+
+# run from backend/: python -m models.recommender.tests
 x = [1,1,1,1,0,1,0,0,0,1,0,0,0,0,1,0,1,0]
 print(rec.recs_essentials(x, None))
 print()
-print(rec.makeup_recommendation('light to medium','all'))
\ No newline at end of file
+print(rec.makeup_recommendation('light to medium','all'))
+
+
+# original DataFrame scoring with a stable sort (ties in catalogue order);
+# cosines are rounded so mathematically equal scores compare equal
+def recs_cs_reference(vector, label, count=5):
+    cs = np.round(cosine_similarity(np.array([vector, ]), rec.one_hot_encodings)[0], 12)
+    dff = rec.df2.assign(cs=cs)
+    dff = dff[dff['label'] == label]
+    recommendations = dff.sort_values('cs', ascending=False, kind='stable').head(count)
+    data = recommendations[['brand', 'name', 'price', 'url','img','skin type','concern']].to_dict('split')['data']
+    return [rec.wrap(element) for element in data]
+
+
+vectors = np.random.default_rng(0).integers(0, 2, size=(500, len(rec.features))).tolist()
+vectors += [x, [1] * len(rec.features), [0] * (len(rec.features) - 1) + [1]]
+for vector in vectors:
+    response = rec.recs_essentials(vector, None)
+    for label in rec.LABELS:
+        assert response[label] == recs_cs_reference(vector, label), (vector, label)
+print(f"recs_essentials OK: {len(vectors)} vectors")
+
+
+# vectorized one-hot build must equal the original per-row loop
+one_hot_loop = np.zeros([rec.entries, len(rec.features)])
+for i in range(rec.entries):
+    for j in range(5):
+        sk_type = rec.df2.iloc[i]['skin type']
+        if sk_type == 'all':
+            one_hot_loop[i][0:5] = 1
+        elif rec.features[j] == sk_type:
+            one_hot_loop[i][j] = 1
+    for j in range(5, len(rec.features)):
+        if rec.features[j] in rec.df2.iloc[i]['concern']:
+            one_hot_loop[i][j] = 1
+assert np.array_equal(rec.build_one_hot(rec.df2), one_hot_loop)
+assert np.array_equal(rec.one_hot_encodings, one_hot_loop)
+print("one_hot_encodings OK")
+
+
+# makeup index must hold exactly what the DataFrame masks returned
+import pandas as pd
+makeup = rec.makeup
+for tone in makeup['skin tone'].unique():
+    for sk_type in list(makeup['skin type'].unique()) + ['unknown']:
+        dfs = [makeup[(makeup['skin tone'] == tone) & (makeup['skin type'] == sk_type) & (makeup['label'] == label)].head(2)
+               for label in rec.MAKEUP_LABELS]
+        data = pd.concat(dfs)[['brand', 'name', 'price', 'url', 'img', 'skin type', 'skin tone']].to_dict('split')['data']
+        assert rec.makeup_recommendation(tone, sk_type, shuffle=False) == [rec.wrap_makeup(e) for e in data], (tone, sk_type)
+        shuffled = rec.makeup_recommendation(tone, sk_type, seed=1)
+        assert shuffled == rec.makeup_recommendation(tone, sk_type, seed=1)
+        assert sorted(map(str, shuffled)) == sorted(str(rec.wrap_makeup(e)) for e in data)
+print("makeup_recommendation OK")
+
+
+# precomputed table (python -m models.recommender.precompute) must match live scoring
+if rec.recs_table is not None:
+    for vector in vectors:
+        key = rec.similarity(vector)
+        for l, label in enumerate(rec.LABELS):
+            assert [rec.wrap(rec.product_data[i]) for i in rec.recs_table[rec.table_row(vector), l]] == \
+                rec.recommend(key, label), (vector, label)
+    print("recs_table OK")
+else:
+    print("recs_table not built - skipped")
@@ -1,22 +1,36 @@
+import os
+import time
 import cv2
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
-pd.options.mode.chained_assignment = None  # default='warn'
+# K-means engine used by skin_detection: "exact", "minibatch" or "subsample"
+CLUSTER_ENGINE = os.environ.get('SKIN_CLUSTER_ENGINE', 'exact')
+# pixels per fit for the approximate engines - lower is faster, higher is closer to "exact"
+CLUSTER_SAMPLE_SIZE = int(os.environ.get('SKIN_CLUSTER_SAMPLE_SIZE', 8192))
 
 # main
 
 
-def skin_detection(img_path):
-    original = read_image(img_path)
+# img is an image path or an already decoded 375x500 BGR array
+# timings, when given, gets the seconds of each stage added to it
+def skin_detection(img, engine=None, sample_size=None, timings=None):
+    clock = time.perf_counter
+    start = clock()
+    original = read_image(img) if isinstance(img, str) else img
     images = image_conversions(original)
+    converted = clock()
     height, width = skin_predict(images)
-    dframe, dframe_removed = dataframe(images)
-    skin_cluster_row, skin_cluster_label = skin_cluster(dframe)
+    predicted = clock()
+    features, keep = feature_matrix(images)
+    skin_cluster_row, skin_cluster_label, labels = cluster_skin(
+        features[keep], engine, sample_size)
     cluster_label_mat = cluster_matrix(
-        dframe, dframe_removed, skin_cluster_label, height, width)
+        labels, keep, skin_cluster_label, height, width)
+    if timings is not None:
+        timings['image_conversions'] = converted - start
+        timings['skin_predict'] = predicted - converted
+        timings['skin_cluster'] = clock() - predicted
     # display_all_images(images)
     # final_segment(images, cluster_label_mat)
     return np.delete(skin_cluster_row, -1)
@@ -57,6 +71,8 @@ def thresholding(images):
 
 
 def plot_histogram(histogram, bin_edges, Totsu, Tmax, Tfinal):
+    import matplotlib.pyplot as plt
+
     plt.figure()
     plt.title("Image Histogram")
     plt.xlabel("pixel value")
@@ -79,9 +95,36 @@ def display_all_images(images):
 # read in image into openCV
 
 
-def read_image(dir):
+# imread flags that make libjpeg decode 8, 4 or 2 times smaller
+REDUCED_READS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+# Largest JPEG reduction that still covers the 375x500 working size (imread
+# applies EXIF orientation, so sideways-stored images compare swapped)
+def reduced_read_flag(image_path):
+    from PIL import ExifTags, Image
+
+    try:
+        with Image.open(image_path) as im:
+            if im.format != 'JPEG':
+                return 3
+            width, height = im.size
+            if im.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    except OSError:
+        return 3
+    for factor, flag in REDUCED_READS:
+        if width // factor >= 375 and height // factor >= 500:
+            return flag
+    return 3
+
+
+def read_image(dir, reduce=True):
     image_path = dir
-    img_BGR = cv2.imread(image_path, 3)
+    img_BGR = cv2.imread(image_path, reduced_read_flag(image_path) if reduce else 3)
+    if img_BGR is None:
+        raise FileNotFoundError(f"Image not found: {image_path}")
     img_BGR = cv2.resize(img_BGR, (375, 500))
     return img_BGR
 
@@ -101,8 +144,36 @@ def image_conversions(img_BGR):
     return images
 
 
+# Skin pixel rules: inclusive (H, Cr, Cb) bounds on the HSV and YCrCb images.
+# Both rule sets share the same bounds; "backend" writes the mask over the
+# grayscale image like this module always did, "ml" keeps the grayscale image
+# intact like ML/Skin_metrics/Skin_tone/skin_detection.py.
+SKIN_RULES = {
+    "backend": {"lower": (0, 140, 90), "upper": (170, 170, 120), "in_place": True},
+    "ml": {"lower": (0, 140, 90), "upper": (170, 170, 120), "in_place": False},
+}
+
+
+# Build the skin mask (255 = skin, 0 = not skin) with two inRange passes
+def skin_mask(hsv, ycrcb, lower, upper, dst=None):
+    hue = cv2.inRange(hsv, (lower[0], 0, 0), (upper[0], 255, 255))
+    chroma = cv2.inRange(ycrcb, (0, lower[1], lower[2]), (255, upper[1], upper[2]))
+    if dst is None:
+        return cv2.bitwise_and(hue, chroma)
+    return cv2.bitwise_and(hue, chroma, dst=dst)
+
+
 # Predict skin pixels
-def skin_predict(images):
+def skin_predict(images, rules="backend"):
+    height, width = images["grayscale"].shape
+    rule = SKIN_RULES[rules]
+    dst = images["grayscale"] if rule["in_place"] else None
+    images["skin_predict"] = skin_mask(
+        images["HSV"], images["YCrCb"], rule["lower"], rule["upper"], dst)
+    return height, width
+
+# Original per-pixel implementation, kept for parity checks and benchmarks
+def skin_predict_loop(images):
     height, width = images["grayscale"].shape
     images["skin_predict"] = images["grayscale"]
 
@@ -114,33 +185,29 @@ def skin_predict(images):
                 images["skin_predict"][i, j] = 0
     return height, width
 
-# Contruction the dataframe for K-means clustering
+# Construct the (N, 4) H/Cr/Cb/I feature matrix for K-means clustering
 
 
-def dataframe(images):
-    dframe = pd.DataFrame()
-    dframe['H'] = images["HSV"].reshape([-1, 3])[:, 0]
+def feature_matrix(images):
+    features = np.empty((images["skin_predict"].size, 4), dtype=np.float32)
+    features[:, 0] = images["HSV"][:, :, 0].ravel()
 
     # Getting the y-x coordintated
     # gray = cv2.cvtColor(images["thresholded"], cv2.COLOR_BGR2GRAY)
     # yx_coords = np.column_stack(np.where(gray >= 0))
-    # dframe['Y'] = yx_coords[:, 0]
-    # dframe['X'] = yx_coords[:, 1]
 
-    dframe['Cr'] = images["YCrCb"].reshape([-1, 3])[:, 1]
-    dframe['Cb'] = images["YCrCb"].reshape([-1, 3])[:, 2]
-    dframe['I'] = images["skin_predict"].reshape(
-        [1, images["skin_predict"].size])[0]
+    features[:, 1] = images["YCrCb"][:, :, 1].ravel()
+    features[:, 2] = images["YCrCb"][:, :, 2].ravel()
+    features[:, 3] = images["skin_predict"].ravel()
 
-    # Remove Black pixels - which are already segmented
-    dframe_removed = dframe[dframe['H'] == 0]
-    dframe.drop(dframe[dframe['H'] == 0].index, inplace=True)
-    return dframe, dframe_removed
+    # Keep mask excludes black pixels - which are already segmented
+    keep = features[:, 0] != 0
+    return features, keep
 
 # cluster skin pixels using K-means
 
 
-def skin_cluster(dframe):
+def skin_cluster(features):
     # K-means
     kmeans = KMeans(
         init="random",
@@ -149,28 +216,91 @@ def skin_cluster(dframe):
         max_iter=100,
         random_state=42
     )
-    kmeans.fit(dframe)
+    kmeans.fit(features)
 
     # Get the skin cluster label - which has the highest I value
     km_cc = kmeans.cluster_centers_
-    skin_cluster_row = km_cc[km_cc[:, -1] == max(km_cc[:, -1]), :]
-    skin_cluster_label = np.where(
-        [np.allclose(row, skin_cluster_row) for row in km_cc])[0][0]
-
-    # Add cluster-label column to the dataframe
-    dframe['cluster'] = kmeans.labels_
-    return skin_cluster_row, skin_cluster_label
-
-
-# Append removed pixels to the dataframe and get cluster matrix
-def cluster_matrix(dframe, dframe_removed, skin_cluster_label, height, width):
-    dframe_removed['cluster'] = np.full((len(dframe_removed.index), 1), -1)
-    dframe = dframe.append(dframe_removed, ignore_index=False).sort_index()
-    dframe['cluster'] = (dframe['cluster'] ==
-                         skin_cluster_label).astype(int) * 255
-    cluster_label_mat = np.asarray(
-        dframe['cluster'].values.reshape(height, width), dtype=np.uint8)
-    return cluster_label_mat
+    skin_cluster_label = int(np.argmax(km_cc[:, -1]))
+    skin_cluster_row = km_cc[skin_cluster_label]
+    return skin_cluster_row, skin_cluster_label, kmeans.labels_
+
+# Fixed skin-biased starting centroids: the mean of the rule-predicted skin
+# pixels plus the non-skin pixels split at their median hue
+def skin_init(features):
+    skin = features[:, 3] == 255
+    init = np.array([[10, 150, 110, 255], [20, 128, 128, 0], [120, 128, 128, 0]], dtype=features.dtype)
+    if skin.any():
+        init[0] = features[skin].mean(axis=0)
+    rest = features[~skin]
+    if len(rest) >= 2:
+        hue = np.median(rest[:, 0])
+        low, high = rest[rest[:, 0] <= hue], rest[rest[:, 0] > hue]
+        if len(low) and len(high):
+            init[1], init[2] = low.mean(axis=0), high.mean(axis=0)
+    return init
+
+# sample_size pixels split between the skin and non-skin strata in
+# proportion to their sizes (at least one from each non-empty stratum),
+# evenly spaced within each stratum
+def stratified_sample(features, sample_size):
+    if len(features) <= sample_size:
+        return features
+    skin = features[:, 3] == 255
+    strata = [features[skin], features[~skin]]
+    n_skin = int(round(sample_size * len(strata[0]) / len(features)))
+    n_skin = min(max(n_skin, int(len(strata[0]) > 0)), sample_size - int(len(strata[1]) > 0))
+    samples = []
+    for stratum, n in zip(strata, (n_skin, sample_size - n_skin)):
+        if n > 0 and len(stratum):
+            samples.append(stratum[np.linspace(0, len(stratum) - 1, n).astype(np.intp)])
+    return np.concatenate(samples)
+
+# K-means on a stratified subsample, then one assignment pass over every pixel
+def skin_cluster_subsample(features, sample_size=CLUSTER_SAMPLE_SIZE):
+    sample = stratified_sample(features, sample_size)
+    kmeans = KMeans(n_clusters=3, init=skin_init(sample), n_init=1, max_iter=100)
+    kmeans.fit(sample)
+    km_cc = kmeans.cluster_centers_
+    skin_cluster_label = int(np.argmax(km_cc[:, -1]))
+    return km_cc[skin_cluster_label], skin_cluster_label, kmeans.predict(features)
+
+# Mini-batch K-means over every pixel, batch_size pixels per step
+def skin_cluster_minibatch(features, sample_size=CLUSTER_SAMPLE_SIZE):
+    kmeans = MiniBatchKMeans(
+        n_clusters=3,
+        init=skin_init(stratified_sample(features, sample_size)),
+        n_init=1,
+        batch_size=sample_size,
+        max_iter=10,
+        random_state=42
+    )
+    kmeans.fit(features)
+    km_cc = kmeans.cluster_centers_
+    skin_cluster_label = int(np.argmax(km_cc[:, -1]))
+    return km_cc[skin_cluster_label], skin_cluster_label, kmeans.labels_
+
+
+CLUSTER_ENGINES = {
+    "exact": skin_cluster,
+    "minibatch": skin_cluster_minibatch,
+    "subsample": skin_cluster_subsample,
+}
+
+# Dispatch to the configured clustering engine
+def cluster_skin(features, engine=None, sample_size=None):
+    engine = engine or CLUSTER_ENGINE
+    if engine not in CLUSTER_ENGINES:
+        raise ValueError(f"Unknown clustering engine: {engine}")
+    if engine == "exact":
+        return skin_cluster(features)
+    return CLUSTER_ENGINES[engine](features, sample_size or CLUSTER_SAMPLE_SIZE)
+
+
+# Scatter the cluster labels back over the full image and get the skin mask
+def cluster_matrix(labels, keep, skin_cluster_label, height, width):
+    cluster_label_mat = np.zeros(height * width, dtype=np.uint8)
+    cluster_label_mat[keep] = (labels == skin_cluster_label) * np.uint8(255)
+    return cluster_label_mat.reshape(height, width)
 
 # final segmentation
 
@@ -23,37 +23,92 @@
 To classify the input skin into one of the 6 skin tones
 """
 
-import pandas as pd
 import os
-from sklearn.neighbors import KNeighborsClassifier
+import threading
+import time
+import numpy as np
 from models.skin_tone.skin_detection import skin_detection
 
 
-def identify_skin_tone(image_path, dataset):
-    # Check if paths are valid
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    if not os.path.exists(dataset):
-        raise FileNotFoundError(f"Dataset not found: {dataset}")
+class SkinToneClassifier:
+    """
+    6-nearest-neighbour (euclidean) skin tone classifier over the H, Cr, Cb
+    columns of the skin tone dataset. Gives the same answers as the
+    KNeighborsClassifier(n_neighbors=6) that used to be fitted per request,
+    but loads the CSV once and reloads it only when its mtime changes.
+    """
+
+    def __init__(self, dataset, n_neighbors=6):
+        self.dataset = dataset
+        self.n_neighbors = n_neighbors
+        self.mtime = None
+        self.state = None
+        self.lock = threading.Lock()
+        self.refresh()
+
+    # Reload the dataset if the CSV changed since the last load
+    def refresh(self):
+        try:
+            mtime = os.stat(self.dataset).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Skin tone dataset not found at {self.dataset}") from None
+        if mtime == self.mtime:
+            return
+        with self.lock:
+            if mtime != self.mtime:
+                self.state = self.load()
+                self.mtime = mtime
+
+    def load(self):
+        data = np.loadtxt(self.dataset, delimiter=',', skiprows=1)
+        X = data[:, [1, 2, 3]]
+        classes, y = np.unique(data[:, 0].astype(int), return_inverse=True)
+        return X, y, classes
+
+    def predict_batch(self, X_test):
+        self.refresh()
+        X, y, classes = self.state
+        X_test = np.asarray(X_test, dtype=np.float64).reshape(-1, X.shape[1])
+        dist = ((X_test[:, None, :] - X[None, :, :]) ** 2).sum(axis=-1)
+        nearest = np.argsort(dist, axis=1, kind='stable')[:, :self.n_neighbors]
+        votes = (y[nearest][:, :, None] == np.arange(len(classes))).sum(axis=1)
+        # argmax keeps the smallest label on ties, like KNeighborsClassifier
+        return classes[votes.argmax(axis=1)]
+
+    def predict(self, vec):
+        return self.predict_batch([vec])[0]
+
+
+classifiers = {}
+classifiers_lock = threading.Lock()
+
+
+# One shared classifier per dataset path
+def get_classifier(dataset):
+    classifier = classifiers.get(dataset)
+    if classifier is None:
+        with classifiers_lock:
+            classifier = classifiers.get(dataset)
+            if classifier is None:
+                classifier = classifiers[dataset] = SkinToneClassifier(dataset)
+    return classifier
+
+
+# image is an image path or an already decoded 375x500 BGR array
+# timings, when given, gets the seconds of each stage added to it
+def identify_skin_tone(image, dataset, timings=None):
+    classifier = get_classifier(dataset)
+
+    # Extract mean H, Cr, Cb values from image
+    mean_color_values = skin_detection(image, timings=timings)
 
-    # Extract mean RGB values from image
-    mean_color_values = skin_detection(image_path)
-    
     # Validate color vector
-    if not isinstance(mean_color_values, (list, tuple)) or len(mean_color_values) != 3:
-        raise ValueError(f"Invalid RGB values from skin_detection: {mean_color_values}")
-    
-    # Load dataset and prepare features and labels
-    df = pd.read_csv(dataset)
-    X = df.iloc[:, [1, 2, 3]].values  # R, G, B values
-    y = df.iloc[:, 0].values         # skin tone labels
-
-    # Train KNN classifier
-    classifier = KNeighborsClassifier(n_neighbors=6, metric='minkowski', p=2)
-    classifier.fit(X, y)
+    if len(mean_color_values) != 3:
+        raise ValueError(f"Invalid color values from skin_detection: {mean_color_values}")
 
     # Predict skin tone
-    X_test = [mean_color_values]
-    y_pred = classifier.predict(X_test)
-
-    return y_pred[0]
+    start = time.perf_counter()
+    tone = classifier.predict(mean_color_values)
+    if timings is not None:
+        timings['knn'] = time.perf_counter() - start
+    return tone
@@ -0,0 +1,71 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.neighbors import KNeighborsClassifier
+from models.skin_tone import skin_detection as sd
+from models.skin_tone.skin_tone_knn import SkinToneClassifier
+
+# run from backend/: python -m models.skin_tone.tests
+TEST_IMAGES = sorted(glob.glob(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'ML', 'Skin_metrics', 'Skin_tone', 'public', 'test images', '*')))
+
+
+def prepared(path):
+    return sd.image_conversions(sd.read_image(path))
+
+
+# vectorized mask must match the per-pixel loop bit for bit
+for path in TEST_IMAGES:
+    for rules in sd.SKIN_RULES:
+        expected = prepared(path)
+        sd.skin_predict_loop(expected)
+        images = prepared(path)
+        gray = images["grayscale"].copy()
+        sd.skin_predict(images, rules)
+        assert np.array_equal(images["skin_predict"], expected["skin_predict"]), (path, rules)
+        if sd.SKIN_RULES[rules]["in_place"]:
+            assert images["skin_predict"] is images["grayscale"]
+        else:
+            assert np.array_equal(images["grayscale"], gray)
+    print(f"skin_predict OK: {os.path.basename(path)}")
+
+
+# original DataFrame segmentation, reproduced to check the array pipeline
+def dataframe_centroid(path):
+    images = prepared(path)
+    sd.skin_predict(images)
+    dframe = pd.DataFrame()
+    dframe['H'] = images["HSV"].reshape([-1, 3])[:, 0]
+    dframe['Cr'] = images["YCrCb"].reshape([-1, 3])[:, 1]
+    dframe['Cb'] = images["YCrCb"].reshape([-1, 3])[:, 2]
+    dframe['I'] = images["skin_predict"].reshape([1, images["skin_predict"].size])[0]
+    dframe.drop(dframe[dframe['H'] == 0].index, inplace=True)
+    kmeans = KMeans(init="random", n_clusters=3, n_init=5, max_iter=100, random_state=42)
+    kmeans.fit(dframe)
+    km_cc = kmeans.cluster_centers_
+    return np.delete(km_cc[km_cc[:, -1] == max(km_cc[:, -1]), :], -1)
+
+
+for path in TEST_IMAGES:
+    expected = dataframe_centroid(path)
+    actual = sd.skin_detection(path)
+    # float32 features vs the float64 DataFrame: allow rounding drift only
+    assert np.allclose(actual, expected, rtol=1e-3, atol=5e-2), (path, actual, expected)
+    print(f"skin_detection OK: {os.path.basename(path)} {actual}")
+
+
+# precompiled classifier must agree with a freshly fitted KNeighborsClassifier
+DATASET = os.path.join(os.path.dirname(__file__), 'skin_tone_dataset.csv')
+df = pd.read_csv(DATASET)
+knn = KNeighborsClassifier(n_neighbors=6, metric='minkowski', p=2)
+knn.fit(df.iloc[:, [1, 2, 3]].values, df.iloc[:, 0].values)
+classifier = SkinToneClassifier(DATASET)
+X_test = np.random.default_rng(0).uniform(0, 255, size=(5000, 3))
+X_test = np.concatenate([X_test, np.round(X_test), df.iloc[:, [1, 2, 3]].values])
+assert np.array_equal(classifier.predict_batch(X_test), knn.predict(X_test))
+for path in TEST_IMAGES:
+    vec = sd.skin_detection(path)
+    assert classifier.predict(vec) == knn.predict([vec])[0], path
+print("SkinToneClassifier OK")
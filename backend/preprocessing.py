@@ -0,0 +1,103 @@
+"""
+Single-decode preprocessing for the analysis routes.
+The uploaded image is decoded once and turned into every array the
+analyzers need, instead of saving it to disk and re-reading it per model.
+OpenCV is imported on first use so importing app.py stays cheap.
+JPEGs are decoded at the smallest DCT scale that still covers the
+analyzers' sizes, and every image is turned upright from its EXIF tag.
+"""
+
+import binascii
+import hashlib
+import re
+import numpy as np
+from PIL import ExifTags, Image, ImageOps
+
+MODEL_INPUT_SIZE = (224, 224)
+SKIN_DETECTION_SIZE = (375, 500)
+# EXIF orientations stored rotated by 90 degrees (width and height swapped)
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+# Decode the upright image. JPEG draft mode makes libjpeg scale by 1/2, 1/4
+# or 1/8 while decoding, to the smallest size still covering
+# SKIN_DETECTION_SIZE, so a 12 MP photo is never decoded at full resolution.
+# Must get the image from Image.open before anything has loaded its pixels.
+def decode_upright(im, reduce=True):
+    orientation = im.getexif().get(ExifTags.Base.Orientation, 1)
+    if reduce and im.format == 'JPEG':
+        width, height = SKIN_DETECTION_SIZE
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        im.draft('RGB', (width, height))
+    if orientation != 1:
+        im = ImageOps.exif_transpose(im)
+    return im
+
+
+# Build the inputs for both Keras models and for skin_detection
+def prepare_image(im, reduce=True):
+    """
+    Returns a dict with:
+        "tensor": (1, 224, 224, 3) float32 RGB in [0, 1] - same as
+                  keras load_img(target_size=(224, 224)) / 255.
+        "BGR":    (500, 375, 3) uint8 BGR - same as
+                  skin_detection.read_image on the saved PNG
+    of the upright image; with reduce=False JPEGs are decoded at full
+    size, as load_img and imread would.
+    """
+    import cv2
+
+    im = decode_upright(im, reduce)
+    if im.mode != 'RGB':
+        im = im.convert('RGB')
+    rgb = np.asarray(im)
+    # keras load_img resizes with nearest-neighbour interpolation
+    small = np.asarray(im.resize(MODEL_INPUT_SIZE, Image.NEAREST), dtype=np.float32)
+    tensor = np.expand_dims(small, axis=0)
+    tensor /= 255.
+    bgr = cv2.cvtColor(cv2.resize(rgb, SKIN_DETECTION_SIZE), cv2.COLOR_RGB2BGR)
+    return {"tensor": tensor, "BGR": bgr}
+
+
+# Exact key for the analyzers' inputs - equal hashes give equal results
+def content_hash(prepared):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(prepared["BGR"]).data)
+    digest.update(np.ascontiguousarray(prepared["tensor"]).data)
+    return digest.hexdigest()
+
+
+# 64-bit difference hash of the grayscale image, stable under re-encoding and small edits
+def perceptual_hash(prepared):
+    import cv2
+
+    gray = cv2.cvtColor(prepared["BGR"], cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+# Upload bodies that are the image file itself, without JSON or multipart framing
+def is_raw_image(mimetype):
+    return mimetype.startswith('image/') or mimetype == 'application/octet-stream'
+
+
+# A JSON body that is exactly {"file": "<base64>"} or
+# {"file": "data:...;base64,<base64>"}, as the frontend sends it
+BASE64_FILE_BODY = re.compile(rb'\s*\{\s*"file"\s*:\s*"(?:data:[^,"]*,)?([A-Za-z0-9+/=]*)"\s*\}\s*')
+
+
+# Image bytes of a {"file": ...} JSON body, decoded straight from a memoryview
+# of the body instead of parsing the JSON, slicing the string and decoding a
+# copy. Only a body with no other keys takes this path; None for anything
+# else (other or nested keys, JSON escapes, invalid base64), in which case
+# callers fall back to json.loads.
+def base64_image_bytes(body):
+    match = BASE64_FILE_BODY.fullmatch(body)
+    if match is None:
+        return None
+    try:
+        return binascii.a2b_base64(memoryview(body)[match.start(1):match.end(1)])
+    except binascii.Error:
+        return None
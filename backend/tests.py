@@ -6,6 +6,26 @@ test_req = {"normal":1, "dry":1, "oily":1, "combination":1, "acne":1, "sensitive
 response = requests.put(BASE + "/recommend", test_req)
 print(response.json())
 
+# Concurrent uploads of different images must each get their own result
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+images = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ML', 'Skin_metrics', 'Skin_tone', 'public', 'test images', '*')))
+
+
+def analyze(path):
+    with open(path, 'rb') as f:
+        return requests.post(BASE + "/upload", files={"file": (os.path.basename(path), f)}).json()["data"]
+
+
+expected = {path: analyze(path) for path in images}
+with ThreadPoolExecutor(len(images)) as pool:
+    for _ in range(5):
+        for path, result in zip(images, pool.map(analyze, images)):
+            assert result == expected[path], (path, result, expected[path])
+print("concurrent uploads OK:", {os.path.basename(p): r["tone"] for p, r in expected.items()})
+
 
 
 
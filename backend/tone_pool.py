@@ -0,0 +1,198 @@
+"""
+Skin tone detection on a pool of pre-spawned worker processes, so the
+OpenCV/K-means work of one request does not hold the GIL of a threaded
+server worker. Workers load the skin tone classifier and skin rules once.
+Images are handed over through fixed slots of one shared memory block
+instead of being pickled; when every slot is in use, submit() waits, so
+`slots` also bounds the tone queue.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+
+# prepare_image's skin detection array: 500x375 BGR uint8
+SLOT_SHAPE = (500, 375, 3)
+SLOT_BYTES = int(np.prod(SLOT_SHAPE))
+# Longest submit() waits for a free slot before giving up
+SLOT_TIMEOUT = 30.
+
+# Worker process state, set by init_worker
+worker_memory = None
+worker_dataset = None
+
+
+# Spawned workers share the parent's resource tracker, where the block is
+# already registered; the parent alone unlinks it
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # track= is Python 3.13+
+        return shared_memory.SharedMemory(name)
+
+
+def init_worker(name, dataset):
+    global worker_memory, worker_dataset
+    from models.skin_tone.skin_tone_knn import get_classifier
+
+    worker_memory = attach(name)
+    worker_dataset = dataset
+    get_classifier(dataset)
+
+
+# Tone of the image in `slot` (or of `image` when it did not fit a slot),
+# plus the seconds of each stage and in total ("tone") spent in the worker
+def detect_tone(slot, shape, image=None):
+    from models.skin_tone.skin_tone_knn import identify_skin_tone
+
+    start = time.perf_counter()
+    if image is None:
+        image = np.ndarray(shape, dtype=np.uint8, buffer=worker_memory.buf, offset=slot * SLOT_BYTES)
+    timings = {}
+    tone = identify_skin_tone(image, dataset=worker_dataset, timings=timings)
+    timings["tone"] = time.perf_counter() - start
+    return tone, timings
+
+
+class TonePool:
+    """
+    submit(bgr) returns a Future of (identify_skin_tone result, {stage: seconds}
+    spent on it in the worker, with the total under "tone").
+    The pool starts on the first submit() in each process (a forked server
+    worker gets its own), or explicitly with start(). When a worker dies the
+    executor breaks; the next submit() replaces it with a fresh one.
+    """
+
+    def __init__(self, dataset, workers=None, slots=None):
+        self.dataset = dataset
+        self.workers = workers or os.cpu_count()
+        self.slots = slots or 2 * self.workers
+        self.pid = None
+        self.lock = threading.Lock()
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "pickled": 0,
+                       "queue_wait_seconds_total": 0.0, "queue_wait_seconds_max": 0.0,
+                       "worker_seconds_total": 0.0, "max_queue_depth": 0, "restarts": 0}
+        self.waiting = 0
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.memory = shared_memory.SharedMemory(create=True, size=self.slots * SLOT_BYTES)
+            self.free = queue.Queue()
+            for slot in range(self.slots):
+                self.free.put(slot)
+            self.executor = self.new_executor()
+            self.pid = os.getpid()
+            atexit.register(self.shutdown)
+        # one task per worker makes the executor spawn all of them now
+        blank = np.zeros(SLOT_SHAPE, dtype=np.uint8)
+        for future in [self.executor.submit(detect_tone, 0, SLOT_SHAPE, blank) for _ in range(self.workers)]:
+            try:
+                future.result()
+            except ValueError:
+                pass  # a blank image has no skin to cluster; only the spawn matters
+
+    # spawned, not forked: workers must not inherit TensorFlow or server threads
+    def new_executor(self):
+        return ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker, initargs=(self.memory.name, self.dataset))
+
+    # Replace `broken` with a new executor, unless another thread already did
+    def restart(self, broken):
+        with self.lock:
+            if self.executor is not broken:
+                return
+            self.executor = self.new_executor()
+            self.counts["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    # detect_tone on the executor, on a fresh one if a dead worker broke it
+    def run(self, *args):
+        executor = self.executor
+        try:
+            return executor.submit(detect_tone, *args)
+        except BrokenProcessPool:
+            self.restart(executor)
+            return self.executor.submit(detect_tone, *args)
+
+    def submit(self, bgr):
+        if self.pid != os.getpid():
+            self.start()
+        bgr = np.asarray(bgr)
+        if bgr.dtype != np.uint8 or bgr.nbytes > SLOT_BYTES:
+            with self.lock:
+                self.counts["submitted"] += 1
+                self.counts["pickled"] += 1
+            try:
+                future = self.run(None, bgr.shape, bgr)
+            except Exception:
+                with self.lock:
+                    self.counts["failed"] += 1
+                raise
+            future.add_done_callback(lambda f: self.finish(f, None))
+            return future
+
+        start = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        try:
+            slot = self.free.get(timeout=SLOT_TIMEOUT)
+        except queue.Empty:
+            raise TimeoutError(f"no free tone slot within {SLOT_TIMEOUT:.0f}s") from None
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.counts["submitted"] += 1
+            self.counts["queue_wait_seconds_total"] += waited
+            self.counts["queue_wait_seconds_max"] = max(self.counts["queue_wait_seconds_max"], waited)
+            self.counts["max_queue_depth"] = max(self.counts["max_queue_depth"], self.queue_depth())
+        view = np.ndarray(bgr.shape, dtype=np.uint8, buffer=self.memory.buf, offset=slot * SLOT_BYTES)
+        view[...] = bgr
+        try:
+            future = self.run(slot, bgr.shape)
+        except Exception:
+            self.free.put(slot)
+            with self.lock:
+                self.counts["failed"] += 1
+            raise
+        future.add_done_callback(lambda f: self.finish(f, slot))
+        return future
+
+    def finish(self, future, slot):
+        if slot is not None:
+            self.free.put(slot)
+        with self.lock:
+            if future.exception() is not None:
+                self.counts["failed"] += 1
+            else:
+                self.counts["completed"] += 1
+                self.counts["worker_seconds_total"] += future.result()[1]["tone"]
+
+    # Images submitted and not finished yet, plus callers waiting for a slot
+    def queue_depth(self):
+        in_flight = self.counts["submitted"] - self.counts["completed"] - self.counts["failed"]
+        return in_flight + self.waiting
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, workers=self.workers, slots=self.slots,
+                        queue_depth=self.queue_depth(), waiting=self.waiting,
+                        started=self.pid == os.getpid())
+
+    def shutdown(self):
+        if self.pid == os.getpid():
+            self.executor.shutdown()
+            self.memory.close()
+            self.memory.unlink()
+            self.pid = None